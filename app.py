@@ -1,9 +1,15 @@
 import streamlit as st
 from src.document_loader import DocumentLoader
+from src.indexer import DirectoryIndexer
 from src.vector_store import VectorStoreManager
 from src.retriever import RAGRetriever
+from src.reranker import Reranker
+from src.context_builder import ContextBuilder, page_label
 from src.llm_chain import CodeWhispererChain
+from src.answer_cache import AnswerCache
+from src.telemetry import TELEMETRY, stage_table
 import os
+import time
 from pathlib import Path
 import json
 
@@ -98,6 +104,49 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# ============================================================================
+# SHARED RESOURCES (one per process, reused by every session)
+# ============================================================================
+@st.cache_resource(show_spinner=False)
+def get_vector_store() -> VectorStoreManager:
+    """Thread-safe store shared by all sessions, so the index is loaded once."""
+    return VectorStoreManager()
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """Expose /metrics for Prometheus when TELEMETRY_PROMETHEUS_PORT is set."""
+    port = os.getenv("TELEMETRY_PROMETHEUS_PORT")
+    return TELEMETRY.serve_prometheus(int(port)) if port else None
+
+
+start_metrics_server()
+
+
+@st.cache_resource(show_spinner="Loading reranker...")
+def get_reranker() -> Reranker:
+    """Local cross-encoder shared by all sessions, with its score cache."""
+    return Reranker()
+
+
+@st.cache_resource(show_spinner=False)
+def get_chain(model: str, temperature: float) -> CodeWhispererChain:
+    # Shared answer cache: repeated questions cost no Gemini quota
+    return CodeWhispererChain(
+        model=model, temperature=temperature, answer_cache=AnswerCache()
+    )
+
+
+def source_location(source: dict) -> str:
+    """Page span and section heading of a cited chunk, if the loader found them."""
+    return " · ".join(part for part in (page_label([source]), source.get("heading")) if part)
+
+
+# The sidebar's stats and upload controls need the store on the first render.
+if "vector_store" not in st.session_state:
+    st.session_state.vector_store = get_vector_store()
+
+
 # ============================================================================
 # SIDEBAR CONFIGURATION
 # ============================================================================
@@ -149,26 +198,77 @@ with st.sidebar:
         1, 10, 3,
         help="More results = more context but slower"
     )
+
+    context_tokens = st.slider(
+        "Context budget (tokens)",
+        500, 8000, 3000, step=250,
+        help="Upper bound on retrieved text sent to Gemini; smaller = faster, less quota"
+    )
+
+    retrieval_mode = st.selectbox(
+        "Retrieval mode",
+        ["hybrid", "vector", "lexical"],
+        help="Hybrid fuses keyword (BM25) and semantic matches; best for exact identifiers and error codes"
+    )
+
+    source_filter = st.multiselect(
+        "Limit to files",
+        get_vector_store().sources(),
+        help="Only search the selected documents (leave empty to search everything)"
+    )
+
+    rerank = st.checkbox(
+        "Rerank candidates (local cross-encoder)",
+        help="Retrieve 50 candidates and keep the best ones by a local CPU model; "
+             "fewer, better chunks reach Gemini"
+    )
+    reranker = None
+    if rerank:
+        try:
+            reranker = get_reranker()
+        except Exception as e:
+            st.warning(f"⚠️ Reranker unavailable: {e}")
     
     st.divider()
     
     # Knowledge Base Management
     st.subheader("📚 Knowledge Base")
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("🔄 Reset KB", use_container_width=True):
-            st.session_state.vector_store.clear_store()
-            st.success("✅ Knowledge base cleared!")
-            st.rerun()
-    
-    with col2:
-        if st.button("ℹ️ Stats", use_container_width=True):
-            if st.session_state.vector_store._emb.size > 0:
-                num_docs = len(st.session_state.vector_store._meta)
-                st.info(f"📊 {num_docs} chunks indexed")
-            else:
-                st.warning("No documents uploaded")
+    if st.button("🔄 Reset KB", use_container_width=True):
+        st.session_state.vector_store.clear_store()
+        st.success("✅ Knowledge base cleared!")
+        st.rerun()
+
+    with st.expander("📈 Pipeline Stats"):
+        num_docs = len(st.session_state.vector_store)
+        if num_docs > 0:
+            st.info(f"📊 {num_docs} chunks indexed")
+        else:
+            st.warning("No documents uploaded")
+
+        snapshot = TELEMETRY.snapshot()
+        counters = snapshot["counters"]
+        st.caption(
+            f"🧠 Embedding cache: {counters.get('embedding_cache_hits', 0):g} hits / "
+            f"{counters.get('embedding_cache_misses', 0):g} misses • "
+            f"{counters.get('embedding_calls', 0):g} API calls"
+        )
+        st.caption(
+            f"💬 Answer cache: {counters.get('answer_cache_hits', 0):g} hits / "
+            f"{counters.get('answer_cache_misses', 0):g} misses • "
+            f"~{counters.get('llm_prompt_tokens', 0) + counters.get('llm_completion_tokens', 0):g} LLM tokens"
+        )
+        if snapshot["spans"]:
+            st.caption("Stage latency (ms)")
+            st.dataframe(stage_table(snapshot), hide_index=True, use_container_width=True)
+        st.download_button(
+            "⬇️ Prometheus metrics", TELEMETRY.prometheus(),
+            file_name="metrics.prom", use_container_width=True
+        )
+        profile_requests = st.checkbox(
+            "Profile questions (cProfile)",
+            help="Shows the slowest functions under each answer"
+        )
     
     st.divider()
     
@@ -187,51 +287,59 @@ with st.sidebar:
     
     if uploaded_files:
         if st.button("➕ Add to Knowledge Base", type="primary", use_container_width=True):
-            loader = DocumentLoader()
+            loader = DocumentLoader(page_cache=os.path.join(
+                st.session_state.vector_store.persist_directory, "pdf_pages.sqlite"
+            ))
             total_chunks = 0
-            successful_files = 0
+            successful_files = []
             failed_files = []
             
             progress_bar = st.progress(0)
             status_text = st.empty()
 
-            for idx, uploaded_file in enumerate(uploaded_files):
-                try:
-                    file_ext = Path(uploaded_file.name).suffix.lower()
-                    status_text.text(f"Processing {uploaded_file.name}...")
-                    
-                    # Save temporary file
-                    file_path = f"./temp_{uploaded_file.name}"
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-
-                    # Load and process
-                    docs = loader.load_single_file(file_path)
-                    st.session_state.vector_store.add_documents(docs)
-                    
-                    # Cleanup
-                    os.remove(file_path)
-                    
-                    total_chunks += len(docs)
-                    successful_files += 1
-                    
-                    # Update progress
-                    progress = (idx + 1) / len(uploaded_files)
-                    progress_bar.progress(progress)
-                    
-                    st.success(f"✅ {uploaded_file.name} ({file_ext}) → {len(docs)} chunks")
+            # Save temporary files, then extract them in parallel
+            temp_paths = {}
+            for uploaded_file in uploaded_files:
+                file_path = f"./temp_{uploaded_file.name}"
+                with open(file_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+                temp_paths[file_path] = uploaded_file.name
 
-                except Exception as e:
-                    failed_files.append((uploaded_file.name, str(e)))
-                    st.error(f"❌ {uploaded_file.name}: {str(e)}")
+            try:
+                # Re-uploading a file replaces its chunks; only changed ones are embedded.
+                for file_path, docs, error in loader.iter_files(temp_paths):
+                    name = temp_paths[file_path]
+                    file_ext = Path(name).suffix.lower()
+                    if error is None:
+                        status_text.text(f"Embedding {name}...")
+                        counts = st.session_state.vector_store.upsert_source(
+                            Path(file_path).name, docs
+                        )
+                        total_chunks += counts["reused"] + counts["embedded"]
+                        successful_files.append(name)
+                        st.success(f"✅ {name} ({file_ext}) → {len(docs)} chunks "
+                                   f"({counts['embedded']} embedded, {counts['kept']} unchanged)")
+                    else:
+                        failed_files.append((name, error))
+                        st.error(f"❌ {name}: {error}")
+                    # Update progress
+                    done = len(successful_files) + len(failed_files)
+                    progress_bar.progress(done / len(temp_paths))
+            except Exception as e:
+                st.error(f"❌ Embedding failed: {str(e)}")
+            finally:
+                # Cleanup
+                for file_path in temp_paths:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
 
             progress_bar.empty()
             status_text.empty()
             
             st.divider()
             
-            if successful_files > 0:
-                st.success(f"🎉 Added {total_chunks} chunks from {successful_files} file(s)!")
+            if successful_files:
+                st.success(f"🎉 Added {total_chunks} chunks from {len(successful_files)} file(s)!")
             
             if failed_files:
                 st.warning(f"⚠️ {len(failed_files)} file(s) had issues")
@@ -278,33 +386,27 @@ st.divider()
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "vector_store" not in st.session_state:
-    st.session_state.vector_store = VectorStoreManager()
-
-# Auto-load documents from data folder on first run
+# Sync documents from data folder on first run (only new/changed files are embedded)
 if "data_folder_loaded" not in st.session_state:
     data_folder = Path("data")
-    if data_folder.exists() and (any(data_folder.glob("*.pdf")) or any(data_folder.glob("*.md")) or any(data_folder.glob("*.txt"))):
-        loader = DocumentLoader()
+    if data_folder.exists():
         try:
-            docs = loader.load_markdown_files(str(data_folder))
-            if docs:
-                st.session_state.vector_store.add_documents(docs)
-                st.session_state.data_folder_loaded = True
+            sync_stats = DirectoryIndexer(st.session_state.vector_store).sync(str(data_folder))
+            changed = sync_stats["added"] + sync_stats["updated"]
+            if changed:
                 # Show info message (only once)
-                st.info(f"📚 Automatically loaded {len(set(doc['source'] for doc in docs))} document(s) from `data/` folder")
+                st.info(f"📚 Automatically indexed {changed} new or changed document(s) from `data/` folder")
         except Exception as e:
             st.warning(f"⚠️ Could not auto-load documents from data folder: {e}")
-            st.session_state.data_folder_loaded = True
-    else:
-        st.session_state.data_folder_loaded = True
+    st.session_state.data_folder_loaded = True
 
 # Initialize Chain and Retriever
-st.session_state.chain = CodeWhispererChain(
-    model=model_choice, temperature=temperature
-)
+st.session_state.chain = get_chain(model_choice, temperature)
 st.session_state.retriever = RAGRetriever(
-    st.session_state.vector_store, k=k_chunks
+    st.session_state.vector_store, k=k_chunks, mode=retrieval_mode,
+    where={"source": source_filter} if source_filter else None,
+    context_builder=ContextBuilder(max_tokens=context_tokens),
+    reranker=reranker,
 )
 
 # ============================================================================
@@ -317,6 +419,12 @@ st.subheader("💬 Conversation", divider=True)
 for message in st.session_state.messages:
     with st.chat_message(message["role"], avatar="🧑" if message["role"] == "user" else "🤖"):
         st.markdown(message["content"])
+
+        if "total_ms" in message:
+            st.caption(
+                f"⚡ First token in {message.get('ttft_ms', message['total_ms']):.0f} ms • "
+                f"total {message['total_ms']:.0f} ms"
+            )
         
         if "sources" in message and message["sources"]:
             with st.expander("📌 Sources used"):
@@ -337,6 +445,9 @@ for message in st.session_state.messages:
                             source['source'].split('/')[-1][:20],
                             f"Score: {source['relevance_score']}"
                         )
+                        location = source_location(source)
+                        if location:
+                            st.caption(location)
 
 # Chat input
 user_input = st.chat_input(
@@ -353,65 +464,83 @@ if user_input:
 
     # Get response from chain
     with st.chat_message("assistant", avatar="🤖"):
-        with st.spinner("🔍 Analyzing documents..."):
-            try:
-                # Get retrieval results
-                result = st.session_state.chain.invoke_with_retriever(
-                    st.session_state.retriever, user_input
-                )
+        try:
+            started = time.perf_counter()
+            with TELEMETRY.profile(enabled=profile_requests) as profile:
+                with st.spinner("🔍 Analyzing documents..."):
+                    # Retrieval finishes first, so sources are known before generation
+                    sources, tokens = st.session_state.chain.stream_with_retriever(
+                        st.session_state.retriever, user_input
+                    )
 
-                answer = result["answer"]
-                sources = result.get("sources", [])
+                timing = {}
+
+                def timed_tokens():
+                    for token in tokens:
+                        if "ttft_ms" not in timing:
+                            timing["ttft_ms"] = (time.perf_counter() - started) * 1000
+                        yield token
+
+                # Display answer as it streams in
+                answer = st.write_stream(timed_tokens())
+            timing["total_ms"] = (time.perf_counter() - started) * 1000
+            st.caption(
+                f"⚡ First token in {timing.get('ttft_ms', timing['total_ms']):.0f} ms • "
+                f"total {timing['total_ms']:.0f} ms"
+            )
+            if profile.get("report"):
+                with st.expander("🔬 Profile"):
+                    st.code(profile["report"])
+
+            # Display sources
+            if sources:
+                with st.expander("📌 Sources used"):
+                    cols = st.columns(min(len(sources), 3))
+
+                    for idx, source in enumerate(sources):
+                        file_ext = Path(source['source']).suffix.lower()
+                        file_type_icon = {
+                            '.pdf': '📄',
+                            '.md': '📝',
+                            '.txt': '📋'
+                        }.get(file_ext, '📄')
+
+                        col = cols[idx % 3]
+                        with col:
+                            st.metric(
+                                file_type_icon + " File",
+                                source['source'].split('/')[-1][:20],
+                                f"Relevance: {source['relevance_score']}"
+                            )
+                            location = source_location(source)
+                            if location:
+                                st.caption(location)
+
+            # Add assistant response to history
+            st.session_state.messages.append(
+                {"role": "assistant", "content": answer, "sources": sources, **timing}
+            )
 
-                # Display answer
-                st.markdown(answer)
-                
-                # Display sources
-                if sources:
-                    with st.expander("📌 Sources used"):
-                        cols = st.columns(min(len(sources), 3))
-                        
-                        for idx, source in enumerate(sources):
-                            file_ext = Path(source['source']).suffix.lower()
-                            file_type_icon = {
-                                '.pdf': '📄',
-                                '.md': '📝',
-                                '.txt': '📋'
-                            }.get(file_ext, '📄')
-                            
-                            col = cols[idx % 3]
-                            with col:
-                                st.metric(
-                                    file_type_icon + " File",
-                                    source['source'].split('/')[-1][:20],
-                                    f"Relevance: {source['relevance_score']}"
-                                )
-
-                # Add assistant response to history
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": answer, "sources": sources}
-                )
+        except Exception as e:
+            error_msg = str(e)
+            st.error(f"❌ Error: {error_msg}")
             
-            except Exception as e:
-                error_msg = str(e)
-                st.error(f"❌ Error: {error_msg}")
-                
-                # Smart error messages
-                if "GOOGLE_API_KEY" in error_msg or "API" in error_msg:
-                    st.info(
-                        "💡 **Fix:** Add `GOOGLE_API_KEY` to your `.env` file\n\n"
-                        "Get a free key at: https://aistudio.google.com"
-                    )
-                elif "vector" in error_msg.lower():
-                    st.info(
-                        "💡 **Fix:** Upload some documents first using the sidebar\n\n"
-                        "Supported formats: PDF, Markdown, Text files"
-                    )
-                elif "rate" in error_msg.lower():
-                    st.warning(
-                        "⏱️ **Rate limit hit!** (5 requests/minute)\n\n"
-                        "Please wait ~1 minute before trying again."
-                    )
+            # Smart error messages
+            if "GOOGLE_API_KEY" in error_msg or "API" in error_msg:
+                st.info(
+                    "💡 **Fix:** Add `GOOGLE_API_KEY` to your `.env` file\n\n"
+                    "Get a free key at: https://aistudio.google.com"
+                )
+            elif "vector" in error_msg.lower():
+                st.info(
+                    "💡 **Fix:** Upload some documents first using the sidebar\n\n"
+                    "Supported formats: PDF, Markdown, Text files"
+                )
+            elif "rate" in error_msg.lower():
+                st.warning(
+                    "⏱️ **Rate limit hit!** (5 requests/minute)\n\n"
+                    "Please wait ~1 minute before trying again."
+                )
 
 # ============================================================================
 # FOOTER & STATS
@@ -0,0 +1,83 @@
+"""Recall@k vs latency of the IVF-Flat index against exact search.
+
+Builds a clustered synthetic corpus in a temporary SegmentStore, then
+sweeps ``nprobe`` and reports recall against the exact top-k.
+
+    python -m benchmarks.bench_ann --rows 200000 --nprobe 1 4 8 16 32
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.ann_index import ExactIndex, IVFFlatIndex, normalize
+from src.segment_store import SegmentStore
+
+
+def _corpus(rng, rows: int, dim: int, clusters: int) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    noise = 0.6 * rng.standard_normal((rows, dim), dtype=np.float32)
+    return normalize(centers[labels] + noise)
+
+
+def _run(index, queries, k, live):
+    results, samples = [], []
+    for q in queries:
+        start = time.perf_counter()
+        rows, _ = index.search(q, k, live)
+        samples.append((time.perf_counter() - start) * 1000)
+        results.append(rows)
+    return results, float(np.median(samples)), float(np.percentile(samples, 95))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix="bench_ann_")
+    try:
+        store = SegmentStore(directory)
+        data = _corpus(rng, args.rows, args.dim, args.clusters)
+        block = 50_000
+        for start in range(0, args.rows, block):
+            n = min(block, args.rows - start)
+            store.append(data[start:start + n], [""] * n, [{}] * n)
+        del data
+        queries = _corpus(rng, args.queries, args.dim, args.clusters)
+        live = store.live_mask()
+
+        exact, p50, p95 = _run(ExactIndex(store), queries, args.k, live)
+        print(f"{'index':>12} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        print(f"{'exact':>12} {1.0:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+
+        start = time.perf_counter()
+        ivf = IVFFlatIndex(store, nlist=args.nlist)
+        ivf.train()
+        print(f"(ivf trained with nlist={len(ivf.centroids)} in {time.perf_counter() - start:.1f}s)")
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            approx, p50, p95 = _run(ivf, queries, args.k, live)
+            recall = np.mean([
+                len(set(a.tolist()) & set(e.tolist())) / max(len(e), 1)
+                for a, e in zip(approx, exact)
+            ])
+            print(f"{'ivf/' + str(nprobe):>12} {recall:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
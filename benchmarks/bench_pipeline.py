@@ -0,0 +1,239 @@
+"""End-to-end pipeline benchmark on a synthetic corpus with stub models.
+
+Generates a reproducible corpus, then measures each stage with the
+deterministic stand-ins for Gemini in ``benchmarks/stubs.py``, which sleep
+for a configurable, injected provider latency:
+
+- ``chunk``:  DocumentLoader.iter_batches over the corpus files
+- ``ingest``: VectorStoreManager.add_documents, per batch
+- ``search``: RAGRetriever.search, per query (plus recall@k of the source);
+  ``--rerank N`` over-fetches N candidates and reranks them with the
+  deterministic TermOverlapScorer
+- ``qa``:     CodeWhispererChain.invoke_with_retriever, per question
+
+Each stage reports throughput, latency percentiles, peak RSS and the
+telemetry breakdown of its inner stages. Results are written as JSON, and
+``--compare`` prints the change against an earlier run:
+
+    python -m benchmarks.bench_pipeline --files 200 --output run.json
+    python -m benchmarks.bench_pipeline --files 200 --compare run.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.stubs import StubEmbeddings, make_stub_llm, sample_questions, synthetic_corpus
+from src.document_loader import DocumentLoader
+from src.llm_chain import CodeWhispererChain
+from src.reranker import Reranker, TermOverlapScorer
+from src.retriever import RAGRetriever
+from src.telemetry import TELEMETRY, Histogram, stage_table
+from src.vector_store import VectorStoreManager
+
+
+def _peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def _stage(run: Callable[[Histogram], int]) -> Dict:
+    """Run one stage; ``run`` records per-item latencies and returns the item count."""
+    TELEMETRY.reset()
+    latencies = Histogram(window=1 << 20)
+    start = time.perf_counter()
+    items = run(latencies)
+    seconds = time.perf_counter() - start
+    summary = latencies.summary()
+    snapshot = TELEMETRY.snapshot()
+    return {
+        "items": items,
+        "seconds": round(seconds, 4),
+        "throughput": round(items / seconds, 2) if seconds else 0.0,
+        "latency_ms": {k: round(summary[k] * 1000, 3)
+                       for k in ("mean", "p50", "p95", "p99", "max")} if summary["count"] else {},
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "breakdown": stage_table(snapshot),
+        "counters": snapshot["counters"],
+    }
+
+
+def _timed(histogram: Histogram, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    histogram.observe(time.perf_counter() - start)
+    return result
+
+
+def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        files = synthetic_corpus(os.path.join(workdir, "corpus"), args.files,
+                                 args.words_per_file, seed=args.seed)
+        results: Dict = {"config": vars(args).copy(), "environment": _environment(), "stages": {}}
+        results["config"].pop("compare", None)
+        stages = results["stages"]
+
+        docs: List[dict] = []
+        loader = DocumentLoader(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                                max_workers=args.workers)
+
+        def chunk(_: Histogram) -> int:
+            for batch in loader.iter_batches(files, batch_size=args.batch_size):
+                docs.extend(batch)
+            return len(docs)
+
+        stages["chunk"] = _stage(chunk)
+        stages["chunk"]["files"] = len(files)
+        stages["chunk"]["peak_rss_children_mb"] = round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+
+        embeddings = StubEmbeddings(dim=args.dim, latency=args.embed_latency,
+                                    per_text=args.embed_per_text)
+        store = VectorStoreManager(
+            persist_directory=os.path.join(workdir, "store"),
+            embeddings=embeddings,
+            cache_embeddings=False,
+            embedding_requests_per_minute=1e9,
+            index=args.index,
+            vector_dtype=args.dtype,
+        )
+
+        def ingest(latencies: Histogram) -> int:
+            added = 0
+            for start in range(0, len(docs), args.batch_size):
+                added += _timed(latencies, store.add_documents, docs[start:start + args.batch_size])
+            return added
+
+        stages["ingest"] = _stage(ingest)
+
+        questions = sample_questions(docs, args.queries, seed=args.seed)
+        reranker = None
+        if args.rerank:
+            reranker = Reranker(TermOverlapScorer(per_pair=args.rerank_per_pair))
+        retriever = RAGRetriever(store, k=args.k, mode=args.mode,
+                                 reranker=reranker, candidates=args.rerank)
+        hits = []
+
+        def search(latencies: Histogram) -> int:
+            for question, source in questions:
+                results = _timed(latencies, retriever.search, question)
+                hits.append(any(meta["source"] == source for _, meta, _ in results))
+            return len(questions)
+
+        stages["search"] = _stage(search)
+        stages["search"]["recall_at_k"] = round(float(np.mean(hits)), 4) if hits else 0.0
+
+        if args.qa_questions:
+            chain = CodeWhispererChain(llm=make_stub_llm(args.llm_latency, args.llm_token_delay))
+            qa_set = [q for q, _ in questions[:args.qa_questions]]
+
+            def qa(latencies: Histogram) -> int:
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    list(pool.map(
+                        lambda q: _timed(latencies, chain.invoke_with_retriever, retriever, q),
+                        qa_set,
+                    ))
+                return len(qa_set)
+
+            stages["qa"] = _stage(qa)
+            stages["qa"]["concurrency"] = args.concurrency
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _print(results: Dict, baseline: Dict = None) -> None:
+    print(f"{'stage':<8} {'items':>8} {'seconds':>9} {'items/s':>10} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'p99 ms':>9} {'peak MB':>9}")
+    for name, s in results["stages"].items():
+        lat = s["latency_ms"]
+        print(f"{name:<8} {s['items']:>8} {s['seconds']:>9.2f} {s['throughput']:>10.1f} "
+              f"{lat.get('p50', float('nan')):>9.2f} {lat.get('p95', float('nan')):>9.2f} "
+              f"{lat.get('p99', float('nan')):>9.2f} {s['peak_rss_mb']:>9.1f}")
+    if "recall_at_k" in results["stages"].get("search", {}):
+        print(f"search recall@{results['config']['k']}: {results['stages']['search']['recall_at_k']}")
+    if baseline is None:
+        return
+
+    print("\nchange vs baseline (throughput, p95 latency):")
+    for name, s in results["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            continue
+        line = f"  {name:<8} throughput {(s['throughput'] / old['throughput'] - 1) * 100:+7.1f}%"
+        old_p95 = old["latency_ms"].get("p95")
+        if old_p95 and s["latency_ms"]:
+            line += f"   p95 {(s['latency_ms']['p95'] / old_p95 - 1) * 100:+7.1f}%"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--words-per-file", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="Loader processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--index", choices=["exact", "ivf"], default="exact")
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default="float32")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--mode", choices=RAGRetriever.MODES, default="vector")
+    parser.add_argument("--rerank", type=int, default=0, metavar="N",
+                        help="Rerank N candidates per query (0 = off)")
+    parser.add_argument("--rerank-per-pair", type=float, default=0.0,
+                        help="Simulated reranker seconds per (query, chunk) pair")
+    parser.add_argument("--qa-questions", type=int, default=50, help="0 skips the QA stage")
+    parser.add_argument("--concurrency", type=int, default=1, help="Parallel QA requests")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per embedding call")
+    parser.add_argument("--embed-per-text", type=float, default=0.0, help="Extra seconds per embedded text")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds to first token")
+    parser.add_argument("--llm-token-delay", type=float, default=0.0, help="Seconds per generated word")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results here")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
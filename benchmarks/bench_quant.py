@@ -0,0 +1,80 @@
+"""Recall and latency of float16 / int8 first-pass scoring with rescoring.
+
+Builds a synthetic corpus in a temporary SegmentStore and compares the
+exact float32 search with the compact representations, reporting the
+in-memory size of the matrix used for the first pass.
+
+    python -m benchmarks.bench_quant --rows 200000 --rescore 1 2 4
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.ann_index import ExactIndex, normalize
+from src.quantization import CompactMatrix, quantized_columns
+from src.segment_store import SegmentStore
+
+
+def _run(index, queries, k, live):
+    results, samples = [], []
+    for q in queries:
+        start = time.perf_counter()
+        rows, _ = index.search(q, k, live)
+        samples.append((time.perf_counter() - start) * 1000)
+        results.append(rows)
+    return results, float(np.median(samples))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix="bench_quant_")
+    try:
+        store = SegmentStore(directory)
+        block = 50_000
+        for start in range(0, args.rows, block):
+            n = min(block, args.rows - start)
+            vecs = normalize(rng.standard_normal((n, args.dim), dtype=np.float32))
+            columns = {}
+            for kind in ("float16", "int8"):
+                columns.update(quantized_columns(vecs, kind))
+            store.append(vecs, [""] * n, [{}] * n, columns=columns)
+        queries = normalize(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+        live = store.live_mask()
+
+        exact_index = ExactIndex(store)
+        exact, p50 = _run(exact_index, queries, args.k, live)
+        f32_mb = args.rows * args.dim * 4 / 1e6
+        print(f"{'dtype':>8} {'rescore':>7} {'MB':>8} {'recall@k':>9} {'p50 ms':>8}")
+        print(f"{'float32':>8} {'-':>7} {f32_mb:>8.1f} {1.0:>9.3f} {p50:>8.2f}")
+
+        for kind in ("float16", "int8"):
+            index = ExactIndex(store)
+            index.compact = CompactMatrix(store, kind)
+            mb = index.compact.nbytes / 1e6
+            for factor in args.rescore:
+                index.rescore_factor = factor
+                approx, p50 = _run(index, queries, args.k, live)
+                recall = np.mean([
+                    len(set(a.tolist()) & set(e.tolist())) / len(e)
+                    for a, e in zip(approx, exact)
+                ])
+                print(f"{kind:>8} {factor:>7} {mb:>8.1f} {recall:>9.3f} {p50:>8.2f}")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
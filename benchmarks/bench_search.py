@@ -0,0 +1,62 @@
+"""Query latency of the vector store scoring kernel.
+
+Compares the original search path (per-query norms + full argsort) with
+the pre-normalized matrix + argpartition top-k used by VectorStoreManager.
+
+    python -m benchmarks.bench_search --sizes 10000 100000 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.ann_index import normalize, top_k
+
+
+def _baseline(emb: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    norms = np.linalg.norm(emb, axis=1) * (np.linalg.norm(q) + 1e-8)
+    scores = (emb @ q) / (norms + 1e-8)
+    return np.argsort(-scores)[:k]
+
+
+def _current(unit: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    return top_k(unit @ normalize(q), k)
+
+
+def _time_ms(fn, repeats: int) -> float:
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>10} {'baseline ms':>12} {'current ms':>11} {'speedup':>8}")
+    for n in args.sizes:
+        emb = rng.standard_normal((n, args.dim), dtype=np.float32)
+        unit = normalize(emb)
+        q = rng.standard_normal(args.dim, dtype=np.float32)
+
+        assert set(_baseline(emb, q, args.k)) == set(_current(unit, q, args.k))
+
+        base = _time_ms(lambda: _baseline(emb, q, args.k), args.repeats)
+        cur = _time_ms(lambda: _current(unit, q, args.k), args.repeats)
+        print(f"{n:>10} {base:>12.2f} {cur:>11.2f} {base / cur:>7.1f}x")
+        del emb, unit
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Throughput of batched multi-query search against a loop over search.
+
+Fills a temporary SegmentStore with random unit vectors and runs the same
+queries through ``index.search`` one at a time and through
+``index.search_many``, for the float32 matrix and optionally a compact copy.
+
+    python -m benchmarks.bench_search_many --rows 100000 --queries 1000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.ann_index import ExactIndex, normalize
+from src.quantization import CompactMatrix
+from src.segment_store import SegmentStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default="float32")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix="bench_many_")
+    try:
+        store = SegmentStore(directory)
+        block = 50_000
+        for start in range(0, args.rows, block):
+            n = min(block, args.rows - start)
+            vecs = normalize(rng.standard_normal((n, args.dim), dtype=np.float32))
+            store.append(vecs, [""] * n, [{}] * n)
+        index = ExactIndex(store)
+        if args.dtype != "float32":
+            index.compact = CompactMatrix(store, args.dtype)
+        queries = normalize(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+        live = store.live_mask()
+
+        start = time.perf_counter()
+        looped = [index.search(q, args.k, live) for q in queries]
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = index.search_many(queries, args.k, live)
+        batch_s = time.perf_counter() - start
+
+        agree = np.mean([
+            len(set(a[0]) & set(b[0])) / args.k for a, b in zip(looped, batched)
+        ])
+        print(f"rows={args.rows} dim={args.dim} queries={args.queries} k={args.k} dtype={args.dtype}")
+        print(f"{'loop':>8}: {loop_s:8.2f} s  {args.queries / loop_s:10.0f} q/s")
+        print(f"{'batched':>8}: {batch_s:8.2f} s  {args.queries / batch_s:10.0f} q/s")
+        print(f"speedup {loop_s / batch_s:.1f}x, top-k agreement {agree:.3f}")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
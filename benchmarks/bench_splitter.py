@@ -0,0 +1,132 @@
+"""Parity and throughput of RecursiveSplitter against LangChain's splitter.
+
+First checks that ``RecursiveSplitter`` yields exactly the chunks of
+``RecursiveCharacterTextSplitter`` (same separators) on a synthetic corpus
+and on randomized edge-case texts, for several chunk sizes, overlaps and
+a token-based length function. Exits non-zero on any mismatch. Then
+times both on the corpus in three layouts: as generated (Markdown
+paragraphs), re-wrapped into short lines without blank lines (like PDF
+text dumps), and without punctuation or line breaks (split down to words):
+
+    python -m benchmarks.bench_splitter --files 50 --repeat 3
+"""
+
+import argparse
+import sys
+import tempfile
+import textwrap
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.stubs import synthetic_corpus
+from src.context_builder import estimate_tokens
+from src.document_loader import SEPARATORS, RecursiveSplitter
+
+
+def _langchain_splitter(chunk_size: int, chunk_overlap: int,
+                        length_function: Optional[Callable[[str], int]] = None):
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=list(SEPARATORS),
+        length_function=length_function or len,
+    )
+
+
+def random_texts(n: int, seed: int = 0) -> List[str]:
+    """Texts heavy in separator runs, leading/trailing whitespace and long unbroken words."""
+    rng = np.random.default_rng(seed)
+    pieces = ["\n\n", "\n", "\n\n\n", ".", "..", " ", "  ", "\t", "word", "x" * 120,
+              "identifier_name", "Sentence one. Sentence two.", "é", ""]
+    texts = ["", " ", "\n\n", "no separators at all" * 40, "x" * 2000]
+    for _ in range(n):
+        size = int(rng.integers(1, 600))
+        texts.append("".join(rng.choice(pieces, size=size)))
+    return texts
+
+
+def check_parity(texts: List[str], configs: List[Tuple[int, int]]) -> int:
+    """Number of (text, config) pairs where the chunks differ."""
+    failures = 0
+    for chunk_size, chunk_overlap in configs:
+        for length_function in (None, estimate_tokens):
+            ours = RecursiveSplitter(chunk_size, chunk_overlap, length_function=length_function)
+            theirs = _langchain_splitter(chunk_size, chunk_overlap, length_function)
+            for text in texts:
+                spans = ours.split_spans(text)
+                expected = theirs.split_text(text)
+                if [text[a:b] for a, b in spans] != expected:
+                    failures += 1
+                    if failures <= 3:
+                        unit = "tokens" if length_function else "chars"
+                        print(f"❌ mismatch: chunk_size={chunk_size} overlap={chunk_overlap} "
+                              f"({unit}), text[:80]={text[:80]!r}")
+    return failures
+
+
+def layouts(corpus: List[str]) -> Dict[str, List[str]]:
+    flat = [text.replace("\n", " ") for text in corpus]
+    return {
+        "markdown": corpus,
+        "pdf-like": ["\n".join(textwrap.wrap(text, 90)) for text in flat],
+        "words": [text.replace(".", " ") for text in flat],
+    }
+
+
+def _time(split: Callable[[str], object], texts: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            split(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--words-per-file", type=int, default=20000)
+    parser.add_argument("--random-texts", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_splitter_") as workdir:
+        paths = synthetic_corpus(workdir, args.files, args.words_per_file, seed=args.seed)
+        corpus = [p.read_text(encoding="utf-8") for p in paths]
+
+    configs = [(args.chunk_size, args.chunk_overlap), (200, 0), (100, 50), (40, 40), (5, 2)]
+    texts = corpus[:5] + random_texts(args.random_texts, seed=args.seed)
+    failures = check_parity(texts, configs)
+    checked = len(texts) * len(configs) * 2
+    if failures:
+        print(f"❌ {failures}/{checked} parity checks failed")
+        sys.exit(1)
+    print(f"✅ parity: {checked} (text, settings) pairs identical to RecursiveCharacterTextSplitter")
+
+    splitters = {
+        "langchain": _langchain_splitter(args.chunk_size, args.chunk_overlap).split_text,
+        "spans": RecursiveSplitter(args.chunk_size, args.chunk_overlap).split_spans,
+        "text": RecursiveSplitter(args.chunk_size, args.chunk_overlap).split_text,
+    }
+    megabytes = sum(len(t.encode("utf-8")) for t in corpus) / 1e6
+    print(f"\ncorpus: {len(corpus)} files, {megabytes:.1f} MB, "
+          f"chunk_size={args.chunk_size} overlap={args.chunk_overlap}; MB/s (best of {args.repeat})")
+    print(f"{'layout':<10} {'langchain':>10} {'spans':>10} {'text':>10} {'speedup':>8}")
+    for layout, texts in layouts(corpus).items():
+        rates = {name: megabytes / _time(split, texts, args.repeat) for name, split in splitters.items()}
+        print(f"{layout:<10} {rates['langchain']:>10.1f} {rates['spans']:>10.1f} "
+              f"{rates['text']:>10.1f} {rates['spans'] / rates['langchain']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Cold-start import cost of the app's modules, measured with -X importtime.
+
+Each measurement runs in a fresh interpreter. The first table lists the
+cumulative import time of every ``src`` module the app imports; then the
+slowest individual imports are shown. Finally the shared store and the chain
+are constructed on an empty temporary store, to check that no provider SDK
+is imported before the first question.
+
+    python -m benchmarks.bench_startup --top 15
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+
+APP_MODULES = [
+    "src.document_loader",
+    "src.indexer",
+    "src.vector_store",
+    "src.retriever",
+    "src.context_builder",
+    "src.llm_chain",
+    "src.answer_cache",
+]
+
+HEAVY = ("langchain", "langchain_core", "langchain_google_genai", "torch",
+         "sentence_transformers", "onnxruntime", "dotenv")
+
+CONSTRUCT = """
+import sys, tempfile, time
+HEAVY = %r
+start = time.perf_counter()
+from src.vector_store import VectorStoreManager
+from src.llm_chain import CodeWhispererChain
+store = VectorStoreManager(persist_directory=tempfile.mkdtemp())
+chain = CodeWhispererChain()
+store.search("warm-up on an empty store")
+print(f"{(time.perf_counter() - start) * 1000:.1f}")
+print(",".join(m for m in HEAVY if m in sys.modules))
+"""
+
+
+def _importtime(statement: str):
+    """Return ``(wall_ms, [(cumulative_us, self_us, module, depth)])`` for one import."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True,
+    )
+    wall = (time.perf_counter() - start) * 1000
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    if proc.returncode != 0:
+        print(proc.stderr.strip().splitlines()[-1])
+    return wall, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'module':<24} {'import ms':>10}")
+    for module in APP_MODULES:
+        _, rows = _importtime(f"import {module}")
+        own = [r for r in rows if r[2] == module]
+        print(f"{module:<24} {own[0][0] / 1000 if own else float('nan'):>10.1f}")
+
+    wall, rows = _importtime("import " + ", ".join(APP_MODULES))
+    top_level = sum(r[0] for r in rows if r[3] == 0)
+    print(f"\nall app modules: {top_level / 1000:.1f} ms imports, "
+          f"{wall:.0f} ms wall (interpreter included)")
+    print("\nslowest imports (self time):")
+    for _, self_us, name, _ in sorted(rows, key=lambda r: -r[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    proc = subprocess.run([sys.executable, "-c", CONSTRUCT % (HEAVY,)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"\nconstruction failed: {proc.stderr.strip().splitlines()[-1]}")
+        return
+    lines = proc.stdout.splitlines()
+    print(f"\nimport + open store + build chain + empty search: {lines[-2]} ms")
+    print(f"heavy modules loaded: {lines[-1] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Append and open cost of the on-disk segment store.
+
+Appends fixed-size batches and reports the time of each append and of
+reopening the store, which should stay flat as the corpus grows.
+
+    python -m benchmarks.bench_store --batches 20 --batch-size 5000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.segment_store import SegmentStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp(prefix="bench_store_")
+    try:
+        store = SegmentStore(directory)
+        print(f"{'rows':>10} {'append ms':>10} {'open ms':>8}")
+        for _ in range(args.batches):
+            vecs = rng.standard_normal((args.batch_size, args.dim), dtype=np.float32)
+            texts = [f"chunk {i}" for i in range(args.batch_size)]
+            metas = [{"source": "bench.md", "chunk_index": str(i)} for i in range(args.batch_size)]
+
+            start = time.perf_counter()
+            store.append(vecs, texts, metas)
+            append_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            reopened = SegmentStore(directory)
+            open_ms = (time.perf_counter() - start) * 1000
+            reopened.close()
+
+            print(f"{len(store):>10} {append_ms:>10.1f} {open_ms:>8.2f}")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Deterministic local stand-ins for Gemini and a synthetic corpus generator.
+
+Used by the benchmarks so runs are reproducible, cost no quota and can
+inject a fixed provider latency.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from src.lexical_index import tokenize
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class StubEmbeddings:
+    """Hashed bag-of-words embeddings: texts sharing words get similar vectors.
+
+    Each token maps to a fixed random direction, so retrieval quality is
+    meaningful (a question built from a chunk finds that chunk). Every call
+    sleeps ``latency`` seconds plus ``per_text`` per text, like a remote API.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0, per_text: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.per_text = per_text
+        self.model = f"stub-embedding-{dim}"
+        self.calls = 0
+        self._tokens: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _token(self, token: str) -> np.ndarray:
+        vec = self._tokens.get(token)
+        if vec is None:
+            vec = np.random.default_rng(_seed(token)).standard_normal(self.dim).astype(np.float32)
+            with self._lock:
+                self._tokens[token] = vec
+        return vec
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            vec += self._token(token)
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + self.per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def make_stub_llm(latency: float = 0.0, token_delay: float = 0.0, answer_words: int = 60):
+    """A LangChain chat model that answers from the prompt's own words.
+
+    Sleeps ``latency`` before the first token and ``token_delay`` per word.
+    The answer is a deterministic slice of the prompt, so repeated runs
+    produce identical output.
+    """
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class StubChatModel(BaseChatModel):
+        model_name: str = "stub-chat"
+
+        @property
+        def _llm_type(self) -> str:
+            return "stub"
+
+        def _words(self, messages) -> List[str]:
+            words = str(messages[-1].content).split()
+            start = _seed(" ".join(words)) % max(1, len(words) - answer_words)
+            return words[start:start + answer_words]
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            words = self._words(messages)
+            time.sleep(latency + token_delay * len(words))
+            message = AIMessage(content=" ".join(words))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(latency)
+            for word in self._words(messages):
+                time.sleep(token_delay)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    return StubChatModel()
+
+
+def synthetic_corpus(directory: str, files: int, words_per_file: int, vocabulary: int = 5000,
+                     seed: int = 0) -> List[Path]:
+    """Write ``files`` Markdown files of Zipf-distributed words and identifiers."""
+    rng = np.random.default_rng(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "xe", "zu", "pa", "qi"]
+    words = sorted({
+        "".join(rng.choice(syllables, size=rng.integers(2, 5))) for _ in range(vocabulary * 2)
+    })[:vocabulary]
+    words = np.array(words)
+    ranks = np.arange(1, len(words) + 1)
+    probs = (1.0 / ranks) / (1.0 / ranks).sum()
+
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        body = rng.choice(words, size=words_per_file, p=probs)
+        lines = [f"# Module {i}", ""]
+        for start in range(0, words_per_file, 80):
+            if start and start % 400 == 0:
+                lines += ["", f"## Section {start // 400}", ""]
+            sentence = " ".join(body[start:start + 80])
+            ident = f"{body[start]}_{body[min(start + 1, words_per_file - 1)]}{i}"
+            lines.append(f"{sentence.capitalize()}. See `{ident}()` for details.")
+        path = out / f"module_{i:05d}.md"
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def sample_questions(docs: List[dict], n: int, words: int = 12,
+                     seed: int = 0) -> List[Tuple[str, str]]:
+    """``(question, source)`` pairs built from word windows of random chunks."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(docs), size=n)
+    questions = []
+    for i in picks:
+        tokens = docs[i]["content"].split()
+        start = int(rng.integers(0, max(1, len(tokens) - words)))
+        questions.append((" ".join(tokens[start:start + words]), docs[i]["source"]))
+    return questions
@@ -0,0 +1,379 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import threading
+
+import numpy as np
+
+from src.segment_store import SegmentStore
+
+
+def normalize(vecs: np.ndarray) -> np.ndarray:
+    """Return float32 rows scaled to unit L2 norm (zero rows stay zero)."""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-8)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first.
+
+    Uses an O(N) argpartition and only sorts the k survivors.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise ``top_k`` for a (queries, rows) score matrix."""
+    n = scores.shape[1]
+    if k <= 0 or n == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, axis=1, kind="stable")
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex:
+    """Interface for nearest-neighbour indexes over a SegmentStore.
+
+    Indexes only hold row ids and auxiliary structures; vectors stay in the
+    store. ``search`` receives a unit-norm query and the store's live mask
+    and returns ``(rows, scores)`` best first.
+
+    When ``compact`` (a quantization.CompactMatrix) is set, candidates are
+    scored on the compact copy and the best ``k * rescore_factor`` are
+    rescored against the exact float32 rows.
+    """
+
+    name = "base"
+    # Upper bound on a (queries, rows) float32 score block in search_many.
+    max_score_floats = 1 << 24
+
+    def __init__(self, store: SegmentStore):
+        self.store = store
+        self.compact = None
+        self.rescore_factor = 4
+
+    def _score(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """First-pass scores for all rows (``rows=None``) or the given rows."""
+        if self.compact is not None:
+            return self.compact.scores(q, rows)
+        if rows is None:
+            return np.concatenate([vecs @ q for _, vecs in self.store.segments()])
+        return self.store.vectors_for(rows) @ q
+
+    def _score_many(self, queries: np.ndarray) -> np.ndarray:
+        """(n_queries, rows) first-pass scores from one matrix product per segment."""
+        if self.compact is not None:
+            return self.compact.scores(queries.T).T
+        out = np.empty((len(queries), len(self.store)), dtype=np.float32)
+        for start, vecs in self.store.segments():
+            out[:, start:start + len(vecs)] = queries @ vecs.T
+        return out
+
+    def _select(self, q: np.ndarray, k: int, rows: np.ndarray,
+                scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Best ``k`` of ``rows`` by first-pass ``scores``, rescored if approximate."""
+        if self.compact is None:
+            top = top_k(scores, k)
+            return rows[top], scores[top]
+        candidates = rows[top_k(scores, k * self.rescore_factor)]
+        exact = self.store.vectors_for(candidates) @ q
+        top = top_k(exact, k)
+        return candidates[top], exact[top]
+
+    def add(self, rows: range) -> None:
+        """Called after rows were appended to the store."""
+
+    def reset(self) -> None:
+        """Called after the store was cleared."""
+
+    def compacted(self, keep: np.ndarray) -> None:
+        """Called after compaction; ``keep`` masks the old rows that survived."""
+
+    def search(self, q: np.ndarray, k: int, live: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def search_rows(self, q: np.ndarray, k: int,
+                    rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k among the given live ``rows`` only; cost is proportional to len(rows)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._select(q, min(k, len(rows)), rows, self._score(q, rows))
+
+    def search_many(self, queries: np.ndarray, k: int,
+                    live: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """``search`` for each row of a (n_queries, dim) matrix."""
+        return [self.search(q, k, live) for q in queries]
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force cosine search over every live row.
+
+    ``search_many`` scores blocks of queries with one matrix-matrix product,
+    keeping each (queries, rows) score block under ``max_score_floats``.
+    """
+
+    name = "exact"
+
+    def search(self, q, k, live):
+        if len(self.store) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        live_count = int(live.sum())
+        scores = self._score(q)
+        if live_count < len(scores):
+            scores = np.where(live, scores, -np.inf)
+        # Narrow to the (rescoring) candidate pool before selecting.
+        pool_size = k * self.rescore_factor if self.compact is not None else k
+        pool = top_k(scores, min(pool_size, live_count))
+        return self._select(q, min(k, live_count), pool, scores[pool])
+
+    def search_many(self, queries, k, live):
+        n = len(self.store)
+        live_count = int(live.sum())
+        if n == 0 or live_count == 0:
+            empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            return [empty] * len(queries)
+        pool_size = k * self.rescore_factor if self.compact is not None else k
+        pool_size = min(pool_size, live_count)
+        k = min(k, live_count)
+
+        # Score a block of queries at a time so the score matrix stays bounded.
+        block = max(1, min(len(queries), self.max_score_floats // n))
+        results: List[Tuple[np.ndarray, np.ndarray]] = []
+        for start in range(0, len(queries), block):
+            qs = queries[start:start + block]
+            scores = self._score_many(qs)
+            if live_count < n:
+                scores[:, ~live] = -np.inf
+            pool = top_k_rows(scores, pool_size)
+            if self.compact is None:
+                best = np.take_along_axis(scores, pool, axis=1)
+            else:
+                vecs = self.store.vectors_for(pool.ravel()).reshape(len(qs), pool_size, -1)
+                exact = np.einsum("qpd,qd->qp", vecs, qs)
+                top = top_k_rows(exact, k)
+                pool = np.take_along_axis(pool, top, axis=1)
+                best = np.take_along_axis(exact, top, axis=1)
+            results.extend(zip(pool, best))
+        return results
+
+
+def _spherical_kmeans(data: np.ndarray, nlist: int, iterations: int,
+                      rng: np.random.Generator) -> np.ndarray:
+    centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), size=len(empty), replace=False)]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class IVFFlatIndex(VectorIndex):
+    """Inverted-file index with k-means coarse centroids (pure NumPy).
+
+    Rows are bucketed by their nearest centroid; a query scores only the
+    rows in its ``nprobe`` closest buckets, so larger ``nprobe`` trades
+    speed for recall. Until the store has ``min_train_rows`` rows the index
+    is untrained and falls back to exact search. Once appends grow the
+    store past ``retrain_factor`` times the rows it was trained on, the
+    index is retrained with an ``nlist`` sized for the new row count.
+
+    Files (next to the segments):
+      - ivf.json: parameters, training size and the store generation
+      - ivf.centroids.npy: (nlist, dim) unit-norm centroids
+      - ivf.assign.bin: append-only int32 bucket id per row
+    """
+
+    name = "ivf"
+
+    def __init__(self, store: SegmentStore, nlist: Optional[int] = None,
+                 nprobe: int = 8, min_train_rows: int = 2000,
+                 train_sample: int = 50000, iterations: int = 10, seed: int = 0,
+                 retrain_factor: float = 4.0):
+        super().__init__(store)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.train_sample = train_sample
+        self.iterations = iterations
+        self.seed = seed
+        self.retrain_factor = retrain_factor
+
+        self._meta_path = os.path.join(store.directory, "ivf.json")
+        self._centroids_path = os.path.join(store.directory, "ivf.centroids.npy")
+        self._assign_path = os.path.join(store.directory, "ivf.assign.bin")
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # Searches may run concurrently and trigger lazy training.
+        self._train_lock = threading.Lock()
+        self._load()
+
+    # -- persistence ---------------------------------------------------
+    def _load(self) -> None:
+        if not (os.path.exists(self._meta_path) and os.path.exists(self._centroids_path)):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("store_id") != self.store.store_id
+                or meta.get("generation", 0) != self.store.generation):
+            return  # stale index of a cleared or compacted store
+        self.centroids = np.load(self._centroids_path)
+        self.trained_rows = int(meta.get("trained_rows", len(self.store)))
+        if os.path.exists(self._assign_path):
+            self.assign = np.fromfile(self._assign_path, dtype="<i4")[:len(self.store)]
+        if len(self.assign) < len(self.store):
+            # Rows appended while the index was not open (or after a crash).
+            self._assign_rows(range(len(self.assign), len(self.store)))
+
+    def _remove_files(self) -> None:
+        for path in (self._meta_path, self._centroids_path, self._assign_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # -- training ------------------------------------------------------
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self) -> None:
+        """(Re)build centroids from a sample of the store and reassign all rows."""
+        n = len(self.store)
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or int(np.clip(4 * np.sqrt(n), 16, 4096))
+        nlist = min(nlist, n)
+        sample = np.sort(rng.choice(n, size=min(n, self.train_sample), replace=False))
+        data = self.store.vectors_for(sample)
+        centroids = _spherical_kmeans(data, nlist, self.iterations, rng)
+        assign = self._assignments(range(0, n), centroids)
+
+        self._remove_files()
+        np.save(self._centroids_path, centroids)
+        with open(self._assign_path, "wb") as f:
+            f.write(assign.astype("<i4").tobytes())
+        with open(self._meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "store_id": self.store.store_id,
+                "generation": self.store.generation,
+                "nlist": int(nlist),
+                "trained_rows": int(n),
+            }, f)
+        # Publish centroids last: searches that skip _train_lock see either
+        # no index (exact fallback) or a complete one.
+        self.assign = assign
+        self.trained_rows = n
+        self._lists = None
+        self.centroids = centroids
+
+    def _assignments(self, rows: range, centroids: np.ndarray,
+                     block: int = 65536) -> np.ndarray:
+        parts = []
+        for start in range(rows.start, rows.stop, block):
+            vecs = self.store.vectors_for(np.arange(start, min(start + block, rows.stop)))
+            parts.append(np.argmax(vecs @ centroids.T, axis=1).astype(np.int32))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def _assign_rows(self, rows: range) -> None:
+        new = self._assignments(rows, self.centroids)
+        if not len(new):
+            return
+        with open(self._assign_path, "ab") as f:
+            f.write(new.astype("<i4").tobytes())
+        self.assign = np.concatenate([self.assign, new])
+        self._lists = None
+
+    # -- VectorIndex ---------------------------------------------------
+    def add(self, rows: range) -> None:
+        # Writers hold the store's write lock, so retraining here never
+        # races a search that still uses the old centroids.
+        if self.trained and len(self.store) <= self.retrain_factor * self.trained_rows:
+            self._assign_rows(rows)
+        elif len(self.store) >= self.min_train_rows:
+            self.train()
+
+    def reset(self) -> None:
+        self._remove_files()
+        self.centroids = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists = None
+
+    def compacted(self, keep: np.ndarray) -> None:
+        # Centroids stay valid; only the per-row assignments are renumbered.
+        if not self.trained:
+            return
+        self.assign = self.assign[keep[:len(self.assign)]]
+        tmp = self._assign_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.assign.astype("<i4").tobytes())
+        os.replace(tmp, self._assign_path)
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["generation"] = self.store.generation
+        with open(self._meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        self._lists = None
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        lists = self._lists
+        if lists is None:
+            order = np.argsort(self.assign, kind="stable").astype(np.int64)
+            offsets = np.concatenate(
+                [[0], np.cumsum(np.bincount(self.assign, minlength=len(self.centroids)))]
+            )
+            lists = self._lists = (order, offsets)
+        return lists
+
+    def search(self, q, k, live):
+        if not self.trained and len(self.store) >= self.min_train_rows:
+            with self._train_lock:
+                if not self.trained:
+                    self.train()
+        if not self.trained:
+            return ExactIndex.search(self, q, k, live)
+        order, offsets = self._inverted_lists()
+        probe = top_k(self.centroids @ q, min(self.nprobe, len(self.centroids)))
+        rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+        rows = rows[live[rows]]
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._select(q, k, rows, self._score(q, rows))
+
+    def search_many(self, queries, k, live):
+        # Each query probes different lists, so only the untrained
+        # (exact) fallback is batched.
+        if not self.trained and len(self.store) < self.min_train_rows:
+            return ExactIndex.search_many(self, queries, k, live)
+        return super().search_many(queries, k, live)
+
+
+INDEX_TYPES: Dict[str, type] = {
+    ExactIndex.name: ExactIndex,
+    IVFFlatIndex.name: IVFFlatIndex,
+}
+
+
+def make_index(kind: str, store: SegmentStore, **params) -> VectorIndex:
+    try:
+        cls = INDEX_TYPES[kind]
+    except KeyError:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {sorted(INDEX_TYPES)}")
+    return cls(store, **params)
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+import re
+import threading
+import time
+
+import numpy as np
+
+from src.telemetry import incr
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, minus trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+
+class AnswerCache:
+    """Two-layer cache of LLM answers in front of the chain.
+
+    - Exact layer: keyed by the normalized question plus the ids of the
+      retrieved chunks.
+    - Semantic layer: among entries built from the same retrieved chunks,
+      returns one whose question embedding has cosine similarity of at
+      least ``threshold`` with the new question.
+
+    Both layers require the retrieved context to be unchanged, so an answer
+    is never served for different evidence. Entries expire after
+    ``ttl_seconds`` and the least recently used are evicted beyond
+    ``max_entries``. ``invalidate()`` drops everything; it runs
+    automatically when the bound knowledge base is cleared.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 24 * 3600,
+                 max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store_id: Optional[str] = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _context_key(chunk_ids: Sequence[str]) -> Tuple[str, ...]:
+        return tuple(chunk_ids)
+
+    def _check_store(self, store_id: Optional[str]) -> None:
+        if store_id is not None and store_id != self._store_id:
+            self._entries.clear()
+            self._store_id = store_id
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        stale = [k for k, e in self._entries.items() if now - e["created"] > self.ttl_seconds]
+        for key in stale:
+            del self._entries[key]
+
+    def lookup(self, question: str, chunk_ids: Sequence[str],
+               embed: Optional[Callable[[], np.ndarray]] = None,
+               store_id: Optional[str] = None) -> Optional[Dict]:
+        """Return a cached result dict or None.
+
+        ``embed`` lazily computes the question embedding and is only called
+        when the exact layer misses.
+        """
+        context = self._context_key(chunk_ids)
+        key = (normalize_question(question), context)
+        with self._lock:
+            self._check_store(store_id)
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                incr("answer_cache_hits")
+                return dict(entry["result"])
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if e["context"] == context and e["vector"] is not None
+            ]
+
+        if candidates and embed is not None:
+            q = np.asarray(embed(), dtype=np.float32)
+            q = q / max(float(np.linalg.norm(q)), 1e-8)
+            sims = np.stack([e["vector"] for _, e in candidates]) @ q
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                with self._lock:
+                    best_key = candidates[best][0]
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        incr("answer_cache_hits")
+                        incr("answer_cache_semantic_hits")
+                        return dict(candidates[best][1]["result"])
+
+        with self._lock:
+            self.misses += 1
+        incr("answer_cache_misses")
+        return None
+
+    def store(self, question: str, chunk_ids: Sequence[str], result: Dict,
+              vector: Optional[np.ndarray] = None, store_id: Optional[str] = None) -> None:
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-8)
+        context = self._context_key(chunk_ids)
+        key = (normalize_question(question), context)
+        with self._lock:
+            self._check_store(store_id)
+            self._entries[key] = {
+                "result": dict(result),
+                "context": context,
+                "vector": vector,
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
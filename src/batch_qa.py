@@ -0,0 +1,271 @@
+"""Answer a JSONL file of questions without the UI.
+
+    python -m src.batch_qa questions.jsonl -o answers.jsonl --rpm 5 --rpd 25
+
+Each input line is ``{"id": ..., "question": ..., "where": {...}}`` (``id``
+defaults to the line number, ``where`` is optional). Retrieval runs in
+vectorized blocks; LLM calls go through a worker pool that respects the
+per-minute and per-day quotas. Results are appended to the output as they
+finish, so an interrupted run resumes where it stopped.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from src.embedding_pipeline import TokenBucket
+from src.llm_chain import CodeWhispererChain
+from src.reranker import Reranker
+from src.retriever import RAGRetriever
+from src.telemetry import incr
+from src.vector_store import VectorStoreManager
+
+
+_RATE_LIMIT_MARKERS = ("429", "resourceexhausted", "resource exhausted", "rate limit", "quota")
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _RATE_LIMIT_MARKERS)
+
+
+class QuotaExhausted(RuntimeError):
+    """The daily request quota is used up."""
+
+
+class Quota:
+    """Per-minute pacing plus a per-day request budget.
+
+    Requests are spaced by a TokenBucket (``per_minute`` / 60 per second,
+    no burst). The daily count is keyed by UTC date and saved in the
+    checkpoint, so restarts do not forget what was already spent today.
+    """
+
+    def __init__(self, per_minute: float, per_day: Optional[int] = None,
+                 day: Optional[str] = None, used_today: int = 0):
+        self.bucket = TokenBucket(per_minute / 60.0, capacity=1.0)
+        self.per_day = per_day
+        self.day = day or self.today()
+        self.used_today = used_today if self.day == self.today() else 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def today() -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def acquire(self) -> None:
+        """Reserve one request, waiting for the per-minute pace."""
+        with self._lock:
+            if self.day != self.today():
+                self.day, self.used_today = self.today(), 0
+            if self.per_day is not None and self.used_today >= self.per_day:
+                raise QuotaExhausted(f"Daily quota of {self.per_day} requests used up")
+            self.used_today += 1
+        self.bucket.acquire()
+
+    def state(self) -> Dict:
+        with self._lock:
+            return {"day": self.day, "used_today": self.used_today}
+
+
+def read_questions(path: str) -> List[Dict]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "question" not in item:
+                raise ValueError(f"{path}:{line_no + 1}: missing 'question'")
+            item.setdefault("id", str(line_no))
+            items.append(item)
+    return items
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids already answered in ``output_path`` (failed ones are retried)."""
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line from an interrupted run.
+            if "error" in record:
+                done.discard(str(record["id"]))
+            else:
+                done.add(str(record["id"]))
+    return done
+
+
+class BatchQA:
+    """Retrieve for many questions at once, then answer them under a quota.
+
+    At most ``max_workers`` LLM calls are in flight and the Quota paces
+    them, so throughput is set by the quota rather than by waiting for
+    each answer in turn. Rate-limit errors are retried with backoff.
+    """
+
+    def __init__(self, retriever: RAGRetriever, chain: CodeWhispererChain, quota: Quota,
+                 max_workers: int = 4, retrieve_batch: int = 256, max_retries: int = 5,
+                 backoff_base: float = 2.0, backoff_max: float = 60.0):
+        self.retriever = retriever
+        self.chain = chain
+        self.quota = quota
+        self.max_workers = max_workers
+        self.retrieve_batch = retrieve_batch
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _contexts(self, items: List[Dict]) -> Iterator[Tuple[Dict, str, List[dict]]]:
+        """``(item, context, sources)`` in blocks of ``retrieve_batch``."""
+        for start in range(0, len(items), self.retrieve_batch):
+            block = items[start:start + self.retrieve_batch]
+            groups: Dict[str, List[Dict]] = {}
+            for item in block:
+                groups.setdefault(json.dumps(item.get("where"), sort_keys=True), []).append(item)
+            for key, group in groups.items():
+                results = self.retriever.retrieve_context_many(
+                    [item["question"] for item in group], where=json.loads(key)
+                )
+                for item, (context, sources) in zip(group, results):
+                    yield item, context, sources
+
+    def _answer(self, item: Dict, context: str, sources: List[dict]) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            self.quota.acquire()
+            try:
+                started = time.perf_counter()
+                result = self.chain.invoke(context, item["question"])
+                break
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt == self.max_retries:
+                    raise
+                incr("batch_qa_rate_limited")
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                time.sleep(delay * (0.5 + random.random() / 2))
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "answer": result["answer"],
+            "model": result.get("model"),
+            "sources": sources,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def run(self, items: List[Dict], output_path: str,
+            checkpoint_path: Optional[str] = None) -> Dict[str, int]:
+        """Answer ``items`` not yet in ``output_path``; returns run counts."""
+        checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+        done = completed_ids(output_path)
+        todo = [item for item in items if str(item["id"]) not in done]
+        stats = {"skipped": len(items) - len(todo), "answered": 0, "failed": 0, "remaining": 0}
+        if not todo:
+            return stats
+
+        exhausted = False
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {}
+            contexts = self._contexts(todo)
+
+            def submit_next() -> bool:
+                job = next(contexts, None)
+                if job is None:
+                    return False
+                pending[pool.submit(self._answer, *job)] = job[0]
+                return True
+
+            while len(pending) < 2 * self.max_workers and submit_next():
+                pass
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item = pending.pop(future)
+                    try:
+                        record = future.result()
+                        stats["answered"] += 1
+                    except QuotaExhausted:
+                        exhausted = True
+                        continue
+                    except Exception as e:
+                        record = {"id": item["id"], "question": item["question"],
+                                  "error": f"{type(e).__name__}: {e}"}
+                        stats["failed"] += 1
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    self._save_checkpoint(checkpoint_path, output_path, stats)
+                    if not exhausted:
+                        submit_next()
+
+        stats["remaining"] = len(todo) - stats["answered"]
+        self._save_checkpoint(checkpoint_path, output_path, stats)
+        if exhausted:
+            print(f"⚠️ Daily quota reached; {stats['remaining']} questions left. "
+                  "Run the same command again to resume.")
+        return stats
+
+    def _save_checkpoint(self, path: str, output_path: str, stats: Dict[str, int]) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"output": output_path, "quota": self.quota.state(), "stats": stats}, f)
+        os.replace(tmp, path)
+
+
+def load_quota(checkpoint_path: str, per_minute: float, per_day: Optional[int]) -> Quota:
+    """Quota that continues the daily count saved in ``checkpoint_path``."""
+    state = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            state = json.load(f).get("quota", {})
+    return Quota(per_minute, per_day, day=state.get("day"), used_today=state.get("used_today", 0))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="Input JSONL with one question per line")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL (appended to)")
+    parser.add_argument("--checkpoint", help="Quota/progress file (default: <output>.checkpoint)")
+    parser.add_argument("--store", default="./chroma_data", help="Vector store directory")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--mode", choices=RAGRetriever.MODES, default="vector")
+    parser.add_argument("--rerank", type=int, default=0, metavar="N",
+                        help="Rerank N candidates with the local cross-encoder (0 = off)")
+    parser.add_argument("--model", default="gemini-2.0-flash")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--rpm", type=float, default=5, help="LLM requests per minute")
+    parser.add_argument("--rpd", type=int, default=25, help="LLM requests per day (0 = unlimited)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent LLM calls")
+    parser.add_argument("--retrieve-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or args.output + ".checkpoint"
+    quota = load_quota(checkpoint, args.rpm, args.rpd or None)
+    runner = BatchQA(
+        RAGRetriever(
+            VectorStoreManager(persist_directory=args.store), k=args.k, mode=args.mode,
+            reranker=Reranker() if args.rerank else None, candidates=args.rerank,
+        ),
+        CodeWhispererChain(model=args.model, temperature=args.temperature),
+        quota,
+        max_workers=args.workers,
+        retrieve_batch=args.retrieve_batch,
+    )
+    started = time.perf_counter()
+    stats = runner.run(read_questions(args.questions), args.output, checkpoint)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {stats['answered']} answered, {stats['failed']} failed, "
+          f"{stats['skipped']} already done, {stats['remaining']} remaining "
+          f"in {elapsed:.1f}s ({stats['answered'] / max(elapsed, 1e-9) * 60:.1f}/min)")
+
+
+if __name__ == "__main__":
+    main()
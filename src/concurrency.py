@@ -0,0 +1,112 @@
+from collections import deque
+from contextlib import contextmanager
+import asyncio
+import os
+import threading
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers.
+
+    Writer preference keeps ingestion from starving while searches keep
+    arriving. Not reentrant: a thread holding the lock must not acquire it
+    again.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class ProcessSemaphore:
+    """Async semaphore shared by every event loop in the process.
+
+    ``asyncio.Semaphore`` is bound to one loop, but Streamlit sessions and
+    ``asyncio.run`` calls each run their own. Waiters here park on a future
+    of their own loop and are woken thread-safely on release.
+    """
+
+    def __init__(self, value: int):
+        if value < 1:
+            raise ValueError("value must be at least 1")
+        self._value = value
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                    raise
+            # The slot was handed over just before cancellation; pass it on.
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(_wake, waiter)
+                return
+            self._value += 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+def _wake(waiter: "asyncio.Future") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+    # A waiter cancelled after the hand-off has already passed the slot on.
+
+
+# Cap on concurrent Gemini requests (query embeddings and LLM calls) made
+# from the async query path, across all sessions of the process.
+REMOTE_CALLS = ProcessSemaphore(int(os.getenv("MAX_CONCURRENT_REMOTE_CALLS", "16")))
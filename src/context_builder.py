@@ -0,0 +1,130 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English and code).
+
+    Good enough for budgeting prompts without a tokenizer round trip.
+    """
+    return (len(text) + 3) // 4
+
+
+def merge_overlapping(left: str, right: str, min_overlap: int = 16,
+                      max_overlap: int = 400) -> Optional[str]:
+    """``left + right`` with the text they share written once, or None.
+
+    Looks for the longest suffix of ``left`` (up to ``max_overlap`` chars)
+    that is a prefix of ``right``, as produced by the splitter's
+    ``chunk_overlap``, and requires at least ``min_overlap`` characters.
+    """
+    if right in left:
+        return left
+    head = right[:min_overlap]
+    if len(head) < min_overlap:
+        return None
+    tail_start = max(0, len(left) - max_overlap)
+    pos = left.find(head, tail_start)
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return left[:pos] + right
+        pos = left.find(head, pos + 1)
+    return None
+
+
+def page_label(metas: List[Dict]) -> Optional[str]:
+    """``"p. 3"`` / ``"pp. 3-5"`` for the PDF pages the chunks span, None without pages."""
+    firsts = [m["page"] for m in metas if m.get("page") is not None]
+    if not firsts:
+        return None
+    first = min(firsts)
+    last = max(m.get("page_end", m["page"]) for m in metas if m.get("page") is not None)
+    return f"p. {first}" if first == last else f"pp. {first}-{last}"
+
+
+class ContextBuilder:
+    """Assemble retrieved chunks into a prompt context under a token budget.
+
+    1. Chunks of the same source that are adjacent (consecutive
+       ``chunk_index``) or share overlapping text are merged into one
+       snippet, with the overlap written once.
+    2. Snippets whose text is contained in a better one are dropped.
+    3. Snippets are packed best score first until ``max_tokens`` is used;
+       a snippet that does not fit is skipped in favour of smaller ones,
+       and only the best one is ever truncated.
+    """
+
+    def __init__(self, max_tokens: int = 3000,
+                 token_counter: Callable[[str], int] = estimate_tokens):
+        self.max_tokens = max_tokens
+        self.count_tokens = token_counter
+
+    def _merge(self, results: List[Tuple[str, Dict, float]]) -> List[Dict]:
+        by_source: Dict[str, List[Tuple[str, Dict, float]]] = {}
+        for item in results:
+            by_source.setdefault(item[1]["source"], []).append(item)
+
+        snippets: List[Dict] = []
+        for source, items in by_source.items():
+            items.sort(key=lambda item: int(item[1].get("chunk_index", 0)))
+            current: Optional[Dict] = None
+            for text, meta, score in items:
+                index = int(meta.get("chunk_index", 0))
+                if current is not None:
+                    merged = merge_overlapping(current["text"], text)
+                    if merged is None and index == current["last"] + 1:
+                        merged = current["text"] + "\n" + text
+                    if merged is not None:
+                        current["text"] = merged
+                        current["last"] = index
+                        current["score"] = max(current["score"], score)
+                        current["members"].append((meta, score))
+                        continue
+                current = {
+                    "source": source, "text": text, "first": index, "last": index,
+                    "score": score, "members": [(meta, score)],
+                }
+                snippets.append(current)
+        return snippets
+
+    def build(self, results: List[Tuple[str, Dict, float]]) -> Tuple[str, List[dict]]:
+        """Return ``(context, sources)`` for ``(text, metadata, score)`` results."""
+        snippets = sorted(self._merge(results), key=lambda s: -s["score"])
+
+        chosen: List[Dict] = []
+        used = 0
+        for snippet in snippets:
+            if any(snippet["text"] in kept["text"] for kept in chosen):
+                continue
+            chunks = (f"chunk {snippet['first']}" if snippet["first"] == snippet["last"]
+                      else f"chunks {snippet['first']}-{snippet['last']}")
+            pages = page_label([meta for meta, _ in snippet["members"]])
+            if pages:
+                chunks = f"{pages}, {chunks}"
+            header = f"--- Snippet {len(chosen) + 1} (from {snippet['source']}, {chunks}) ---\n"
+            cost = self.count_tokens(header + snippet["text"])
+            if used + cost > self.max_tokens:
+                if chosen:
+                    continue
+                # Always keep some context: cut the best snippet to fit.
+                room = max(0, self.max_tokens - self.count_tokens(header))
+                ratio = room / max(1, self.count_tokens(snippet["text"]))
+                snippet["text"] = snippet["text"][:int(len(snippet["text"]) * ratio)]
+                cost = self.count_tokens(header + snippet["text"])
+            snippet["block"] = header + snippet["text"]
+            chosen.append(snippet)
+            used += cost
+
+        sources = [
+            {
+                "source": meta["source"],
+                "chunk": meta["chunk_index"],
+                "chunk_id": meta.get("chunk_id"),
+                "page": meta.get("page"),
+                "page_end": meta.get("page_end"),
+                "heading": meta.get("heading"),
+                "relevance_score": round(float(score), 4),
+            }
+            for snippet in chosen
+            for meta, score in snippet["members"]
+        ]
+        return "\n\n".join(s["block"] for s in chosen), sources
@@ -1,68 +1,626 @@
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import accumulate
 from pathlib import Path
-from typing import List
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
 import os
+import re
+import time
+
+import numpy as np
+
+from src.page_cache import PageCache
+from src.telemetry import TELEMETRY, incr
+
+
+SUPPORTED_PATTERNS = ("*.md", "*.txt", "*.pdf")
+SEPARATORS = ("\n\n", "\n", ".", " ")
+
+
+class _SeparatorIndex:
+    """Positions of the separators in one text.
+
+    Single-character separators are located with one vectorized pass over
+    the whole text, then every range lookup is a binary search. Longer
+    separators are matched with ``str.find`` within the range, since their
+    non-overlapping matches depend on where the range starts.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._codes: Optional[np.ndarray] = None
+        self._positions: Dict[str, List[int]] = {}
+
+    def _single(self, sep: str) -> List[int]:
+        positions = self._positions.get(sep)
+        if positions is None:
+            if self._codes is None:
+                text = self.text
+                self._codes = (np.frombuffer(text.encode("ascii"), dtype=np.uint8) if text.isascii()
+                               else np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32))
+            if self._codes.dtype == np.uint8 and ord(sep) > 127:
+                positions = []
+            else:
+                positions = np.flatnonzero(self._codes == ord(sep)).tolist()
+            self._positions[sep] = positions
+        return positions
+
+    def contains(self, sep: str, start: int, end: int) -> bool:
+        if len(sep) == 1:
+            positions = self._single(sep)
+            return bisect_left(positions, start) < bisect_left(positions, end)
+        return self.text.find(sep, start, end) != -1
+
+    def bounds(self, sep: str, start: int, end: int) -> List[int]:
+        """Piece boundaries of ``text[start:end]`` cut before every ``sep``."""
+        if start >= end:
+            return []
+        if not sep:
+            return list(range(start, end + 1))
+        if len(sep) == 1:
+            positions = self._single(sep)
+            cuts = positions[bisect_right(positions, start):bisect_left(positions, end)]
+        else:
+            cuts = []
+            pos = self.text.find(sep, start + 1, end)
+            if self.text.startswith(sep, start, end):
+                pos = self.text.find(sep, start + len(sep), end)
+            while pos != -1:
+                cuts.append(pos)
+                pos = self.text.find(sep, pos + len(sep), end)
+        return [start, *cuts, end]
+
+
+class RecursiveSplitter:
+    """Offset-based equivalent of LangChain's RecursiveCharacterTextSplitter.
+
+    Gives the same chunks for the same settings (each separator is kept at
+    the start of the piece it opens, chunks are whitespace-stripped), but
+    works on ``(start, end)`` offsets into the original text: separators
+    are located in one pass, pieces are never copied, and packing pieces
+    into chunks costs a binary search per chunk rather than a step per
+    piece. Only the final chunks are sliced out.
+
+    ``length_function`` measures pieces in other units, e.g.
+    ``estimate_tokens`` or a tokenizer's count, to split on tokens instead
+    of characters. It must be a module-level function when the splitter
+    runs in worker processes.
+    """
+
+    def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100,
+                 separators: Tuple[str, ...] = SEPARATORS,
+                 length_function: Optional[Callable[[str], int]] = None):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if not 0 <= chunk_overlap <= chunk_size:
+            raise ValueError(f"chunk_overlap must be between 0 and chunk_size, got {chunk_overlap}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+        self.length_function = length_function
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """``(start, end)`` of each chunk, so that ``text[start:end]`` is the chunk."""
+        spans: List[Tuple[int, int]] = []
+        self._split(_SeparatorIndex(text), 0, len(text), 0, spans)
+        return spans
+
+    def _split(self, index: _SeparatorIndex, start: int, end: int, level: int,
+               out: List[Tuple[int, int]]) -> None:
+        # Use the first separator that occurs in this range; finer ones
+        # are only tried on pieces that are still too long.
+        sep, finer = self.separators[-1], len(self.separators)
+        for i in range(level, len(self.separators)):
+            if not self.separators[i]:
+                sep = ""
+                break
+            if index.contains(self.separators[i], start, end):
+                sep, finer = self.separators[i], i + 1
+                break
+
+        bounds = index.bounds(sep, start, end)
+        if self.length_function is None:
+            lengths = [b - a for a, b in zip(bounds, bounds[1:])]
+        else:
+            lengths = [self.length_function(index.text[a:b]) for a, b in zip(bounds, bounds[1:])]
+
+        first = 0
+        size = self.chunk_size
+        for big in [i for i, n in enumerate(lengths) if n >= size] + [len(lengths)]:
+            if big > first:
+                self._merge(index.text, bounds, lengths, first, big, out)
+            if big == len(lengths):
+                break
+            if finer >= len(self.separators):
+                out.append((bounds[big], bounds[big + 1]))  # cannot split further
+            else:
+                self._split(index, bounds[big], bounds[big + 1], finer, out)
+            first = big + 1
+
+    def _merge(self, text: str, bounds: List[int], lengths: List[int], lo: int, hi: int,
+               out: List[Tuple[int, int]]) -> None:
+        """Pack pieces ``lo:hi`` into chunks, carrying up to ``chunk_overlap`` over.
+
+        Same greedy packing as LangChain's ``_merge_splits``, but with
+        prefix sums: the end of each chunk and the start of the next
+        (after dropping pieces beyond the overlap) are binary searches.
+        """
+        sep = 0 if self.length_function is None else self.length_function("")
+        size, overlap = self.chunk_size, self.chunk_overlap
+        # cum[k] - cum[h] - sep is the length of pieces h..k-1 joined.
+        pieces = lengths[lo:hi]
+        cum = list(accumulate((n + sep for n in pieces) if sep else pieces, initial=0))
+        count = hi - lo
+        head = last = 0
+        while True:
+            last = max(last + 1, bisect_right(cum, cum[head] + sep + size) - 1)
+            if last >= count:
+                break
+            self._emit(text, bounds[lo + head], bounds[lo + last], out)
+            # Drop pieces until at most ``overlap`` is left and the next piece fits.
+            head = bisect_left(cum, cum[last] - overlap - sep, head, last)
+            if cum[last + 1] - cum[head] - sep > size and cum[last] - cum[head] - sep > 0:
+                head = min(bisect_left(cum, cum[last + 1] - size - sep, head, last),
+                           bisect_left(cum, cum[last] - sep, head, last))
+        self._emit(text, bounds[lo + head], bounds[hi], out)
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, out: List[Tuple[int, int]]) -> None:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            out.append((start, end))
+
+
+# One splitter per worker process, keyed by its settings.
+_SPLITTERS: Dict[Tuple, RecursiveSplitter] = {}
+
+
+def _splitter(chunk_size: int, chunk_overlap: int,
+              length_function: Optional[Callable[[str], int]] = None) -> RecursiveSplitter:
+    key = (chunk_size, chunk_overlap, length_function)
+    if key not in _SPLITTERS:
+        _SPLITTERS[key] = RecursiveSplitter(chunk_size, chunk_overlap,
+                                            length_function=length_function)
+    return _SPLITTERS[key]
+
+
+_MD_HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+_FENCE = re.compile(r"^(?:```|~~~)", re.MULTILINE)
+# Numbered section titles as PDF text extraction yields them, e.g. "2.3 Cache settings".
+_NUMBERED_HEADING = re.compile(
+    r"^(\d{1,2}(?:\.\d{1,2}){0,3})\.?[ \t]+([A-Z][^\n.:;]{1,78})$", re.MULTILINE
+)
+
+
+def _headings(content: str, numbered: bool = False) -> Tuple[List[int], List[str]]:
+    """Offsets of the headings in ``content`` and the heading path (``A > B``) at each.
+
+    Markdown headings outside code fences always count; numbered section
+    titles only when ``numbered`` (PDF text has no markup).
+    """
+    fences = [m.start() for m in _FENCE.finditer(content)]
+    found = [(m.start(), len(m.group(1)), m.group(2))
+             for m in _MD_HEADING.finditer(content)
+             if bisect_right(fences, m.start()) % 2 == 0]
+    if numbered:
+        found += [(m.start(), m.group(1).count(".") + 1, f"{m.group(1)} {m.group(2).strip()}")
+                  for m in _NUMBERED_HEADING.finditer(content)]
+        found.sort()
+    offsets, paths, stack = [], [], []
+    for offset, level, title in found:
+        stack = [entry for entry in stack if entry[0] < level] + [(level, title)]
+        offsets.append(offset)
+        paths.append(" > ".join(t for _, t in stack))
+    return offsets, paths
+
+
+def _chunks(splitter: RecursiveSplitter, content: str, name: str,
+            page_starts: Optional[List[int]] = None) -> List[dict]:
+    """Chunk dicts with their offsets, heading path and (for PDFs) 1-based page span."""
+    offsets, paths = _headings(content, numbered=page_starts is not None)
+    docs = []
+    for i, (start, end) in enumerate(splitter.split_spans(content)):
+        doc = {"content": content[start:end], "source": name, "chunk_index": i,
+               "start": start, "end": end}
+        if page_starts is not None:
+            doc["page"] = bisect_right(page_starts, start)
+            doc["page_end"] = bisect_right(page_starts, end - 1)
+        heading = bisect_right(offsets, start) - 1
+        if heading >= 0:
+            doc["heading"] = paths[heading]
+        docs.append(doc)
+    return docs
+
+
+def _is_pdf(path: str) -> bool:
+    return Path(path).suffix.lower() == ".pdf"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# One page cache connection per worker process, keyed by path.
+_PAGE_CACHES: Dict[str, PageCache] = {}
+
+
+def _page_cache(path: Optional[str]) -> Optional[PageCache]:
+    if path is None:
+        return None
+    if path not in _PAGE_CACHES:
+        _PAGE_CACHES[path] = PageCache(path)
+    return _PAGE_CACHES[path]
+
+
+def _pdf_reader(file_path: str):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError("pypdf not installed. Run: pip install pypdf")
+    return PdfReader(file_path)
+
+
+def _object_digest(obj, memo: Dict) -> bytes:
+    """Digest of a PDF object and everything it references, except ``/Parent``.
+
+    Covers fonts with their ``/Encoding`` and ``/ToUnicode`` maps and Form
+    XObjects with their own resources. Image data is skipped: it does not
+    change the text. ``memo`` caches indirect objects shared across pages.
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref not in memo:
+            memo[ref] = b"cycle"  # placeholder while the object is walked
+            memo[ref] = _object_digest(obj.get_object(), memo)
+        return memo[ref]
+    digest = hashlib.sha256()
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj):
+            if key != "/Parent":
+                digest.update(key.encode("utf-8"))
+                digest.update(_object_digest(obj.raw_get(key), memo))
+        if isinstance(obj, StreamObject) and obj.get("/Subtype") != "/Image":
+            digest.update(obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            digest.update(_object_digest(item, memo))
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+    return digest.digest()
+
+
+def _page_key(page, memo: Optional[Dict] = None) -> str:
+    """Hash of what a page's text comes from: its content stream and resources."""
+    digest = hashlib.sha256(b"pypdf-text-v2")
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    if "/Resources" in page:
+        digest.update(_object_digest(page.raw_get("/Resources"), {} if memo is None else memo))
+    return digest.hexdigest()
+
+
+def _plan_pdf(file_path: str, cache_path: Optional[str]) -> Dict:
+    """Page keys of a PDF plus the page texts already cached (None = to extract).
+
+    A file whose sha256 and pages are all cached is not parsed at all.
+    """
+    start = time.perf_counter()
+    cache = _page_cache(cache_path)
+    sha = file_sha256(file_path) if cache else ""
+    keys = cache.file_pages(sha) if cache else None
+    texts = cache.get_many(keys) if keys is not None else None
+    if texts is None or None in texts:
+        keys, memo = [], {}
+        for index, page in enumerate(_pdf_reader(file_path).pages):
+            try:
+                keys.append(_page_key(page, memo))
+            except Exception:
+                keys.append(f"{sha or file_sha256(file_path)}:{index}")
+        if cache:
+            texts = cache.get_many(keys)
+            cache.put_file(sha, keys)
+        else:
+            texts = [None] * len(keys)
+    return {"keys": keys, "texts": texts, "seconds": time.perf_counter() - start}
+
+
+def _extract_pdf_pages(file_path: str, pages: Dict[int, str],
+                       cache_path: Optional[str]) -> Dict:
+    """Extract the text of ``pages`` (index -> cache key); runs inside a worker process."""
+    start = time.perf_counter()
+    reader = _pdf_reader(file_path)
+    texts = {index: reader.pages[index].extract_text() or "" for index in pages}
+    cache = _page_cache(cache_path)
+    if cache:
+        cache.put_many({pages[index]: text for index, text in texts.items()})
+    return {"texts": texts, "seconds": time.perf_counter() - start}
+
+
+def _pdf_pages(file_path: str, cache_path: Optional[str]) -> Tuple[List[str], float, int]:
+    """All page texts of a PDF in one process; returns ``(texts, seconds, cached pages)``."""
+    plan = _plan_pdf(file_path, cache_path)
+    texts, seconds = plan["texts"], plan["seconds"]
+    missing = {i: plan["keys"][i] for i, text in enumerate(texts) if text is None}
+    if missing:
+        extracted = _extract_pdf_pages(file_path, missing, cache_path)
+        for index, text in extracted["texts"].items():
+            texts[index] = text
+        seconds += extracted["seconds"]
+    return texts, seconds, len(texts) - len(missing)
+
+
+def _join_pages(texts: List[str]) -> Tuple[str, List[int]]:
+    """Pages joined by blank lines, plus the offset where each page starts."""
+    starts, offset = [], 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 2
+    return "\n\n".join(texts), starts
+
+
+def _pdf_loaded(file_path: str, texts: List[str], seconds: float, cached: int,
+                chunk_size: int, chunk_overlap: int,
+                length_function: Optional[Callable[[str], int]] = None):
+    """Split extracted pages into chunks, in the ``_load_file_timed`` result format."""
+    timings = {"ingest_extract": seconds}
+    counts = {"pdf_pages_cached": cached, "pdf_pages_extracted": len(texts) - cached}
+    try:
+        content, page_starts = _join_pages(texts)
+        if not content.strip():
+            raise ValueError("No text extracted from PDF (possibly scanned image)")
+        start = time.perf_counter()
+        docs = _chunks(_splitter(chunk_size, chunk_overlap, length_function),
+                       content, Path(file_path).name, page_starts)
+        timings["ingest_split"] = time.perf_counter() - start
+    except Exception as e:
+        return (file_path, [], str(e)), timings, counts
+    return (file_path, docs, None), timings, counts
+
+
+def _load_file(file_path: str, chunk_size: int, chunk_overlap: int,
+               length_function: Optional[Callable[[str], int]] = None,
+               page_cache: Optional[str] = None) -> Tuple[str, List[dict], Optional[str]]:
+    """Extract and split one file; runs inside a worker process.
+
+    Errors are returned rather than raised so one bad file does not stop
+    the rest of the batch.
+    """
+    return _load_file_timed(file_path, chunk_size, chunk_overlap, length_function, page_cache)[0]
+
+
+def _load_file_timed(file_path: str, chunk_size: int, chunk_overlap: int,
+                     length_function: Optional[Callable[[str], int]] = None,
+                     page_cache: Optional[str] = None):
+    """``_load_file`` plus its stage timings and counters (workers cannot record them)."""
+    if _is_pdf(file_path):
+        try:
+            texts, seconds, cached = _pdf_pages(file_path, page_cache)
+        except Exception as e:
+            return (file_path, [], f"PDF extraction failed: {e}"), {}, {}
+        return _pdf_loaded(file_path, texts, seconds, cached,
+                           chunk_size, chunk_overlap, length_function)
+
+    timings: Dict[str, float] = {}
+    try:
+        start = time.perf_counter()
+        content = DocumentLoader._extract_text(file_path)
+        timings["ingest_extract"] = time.perf_counter() - start
+        start = time.perf_counter()
+        docs = _chunks(_splitter(chunk_size, chunk_overlap, length_function),
+                       content, Path(file_path).name)
+        timings["ingest_split"] = time.perf_counter() - start
+    except Exception as e:
+        return (file_path, [], str(e)), timings, {}
+    return (file_path, docs, None), timings, {}
+
+
+def _record(loaded) -> Tuple[str, List[dict], Optional[str]]:
+    result, timings, counts = loaded
+    for stage, seconds in timings.items():
+        TELEMETRY.observe(stage, seconds, file=Path(result[0]).name)
+    for name, value in counts.items():
+        if value:
+            incr(name, value)
+    incr("ingest_files" if result[2] is None else "ingest_failed_files")
+    return result
+
+
+def list_documents(directory: str) -> List[Path]:
+    """Supported files directly inside ``directory``."""
+    data_path = Path(directory)
+    return [p for pattern in SUPPORTED_PATTERNS for p in data_path.glob(pattern)]
 
 
 class DocumentLoader:
-    """Load and process documentation files (MD, TXT, PDF)."""
+    """Load and process documentation files (MD, TXT, PDF).
+
+    ``iter_files`` / ``iter_batches`` stream chunks from many files: text
+    extraction and splitting run on a process pool (``max_workers``, default
+    all cores) with a bounded number of files in flight, so memory stays flat
+    however large the corpus is.
+
+    PDFs are extracted page by page: a large PDF is spread over the pool
+    in tasks of up to ``pages_per_task`` pages, and with ``page_cache`` (a
+    SQLite path, see PageCache) pages whose content did not change are
+    never extracted again.
+
+    Each chunk dict carries ``start`` / ``end``, its character offsets in
+    the extracted text, ``heading`` (the path of the section it starts in)
+    when there is one, and for PDFs the 1-based ``page`` / ``page_end``
+    it spans. ``length_function`` (see RecursiveSplitter) sizes chunks in
+    tokens instead of characters.
+    """
 
-    def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100):
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", ".", " "]
-        )
+    def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100,
+                 max_workers: Optional[int] = None,
+                 length_function: Optional[Callable[[str], int]] = None,
+                 page_cache: Optional[str] = None, pages_per_task: int = 16):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.length_function = length_function
+        self.page_cache = page_cache
+        self.pages_per_task = pages_per_task
+
+    @property
+    def splitter(self) -> RecursiveSplitter:
+        return _splitter(self.chunk_size, self.chunk_overlap, self.length_function)
+
+    def _job(self, path: str) -> Tuple:
+        return path, self.chunk_size, self.chunk_overlap, self.length_function, self.page_cache
 
     def load_markdown_files(self, directory: str) -> List[dict]:
         """Load all .md/.txt/.pdf files from a directory."""
         docs: List[dict] = []
-        data_path = Path(directory)
+        for batch in self.iter_batches(list_documents(directory)):
+            docs.extend(batch)
+        return docs
 
-        # Support multiple file types
-        for file_path in list(data_path.glob("*.md")) + list(data_path.glob("*.txt")) + list(data_path.glob("*.pdf")):
+    def iter_files(self, paths: Iterable[str]) -> Iterator[Tuple[str, List[dict], Optional[str]]]:
+        """Yield ``(path, chunks, error)`` per file, in completion order.
+
+        ``error`` is None on success. At most ``2 * max_workers`` tasks are
+        in flight; pages of PDFs already started go before new files.
+        """
+        paths = [str(p) for p in paths]
+        pdfs = any(_is_pdf(p) for p in paths)
+        if self.max_workers == 1 or (len(paths) <= 1 and not pdfs):
+            for path in paths:
+                yield _record(_load_file_timed(*self._job(path)))
+            return
+
+        workers = self.max_workers if pdfs else min(self.max_workers, len(paths))
+        queue: Deque[str] = deque(paths)
+        page_tasks: Deque[Tuple[str, Dict[int, str]]] = deque()
+        in_progress: Dict[str, Dict] = {}
+        pending: Dict = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+
+            def fill() -> None:
+                while len(pending) < 2 * workers and (page_tasks or queue):
+                    if page_tasks:
+                        path, pages = page_tasks.popleft()
+                        future = pool.submit(_extract_pdf_pages, path, pages, self.page_cache)
+                        pending[future] = ("pages", path)
+                        continue
+                    path = queue.popleft()
+                    if _is_pdf(path):
+                        pending[pool.submit(_plan_pdf, path, self.page_cache)] = ("plan", path)
+                    else:
+                        pending[pool.submit(_load_file_timed, *self._job(path))] = ("file", path)
+
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, path = pending.pop(future)
+                    if kind == "file":
+                        loaded = future.result()
+                    else:
+                        loaded = self._pdf_progress(kind, path, future, in_progress,
+                                                    page_tasks, workers)
+                    fill()
+                    if loaded is not None:
+                        yield _record(loaded)
+
+    def _pdf_progress(self, kind: str, path: str, future, in_progress: Dict[str, Dict],
+                      page_tasks: Deque, workers: int):
+        """Account for a finished plan or page task; returns the loaded PDF once complete."""
+        if kind == "plan":
             try:
-                content = self._extract_text(str(file_path))
-                chunks = self.splitter.split_text(content)
-
-                for i, chunk in enumerate(chunks):
-                    docs.append({
-                        "content": chunk,
-                        "source": file_path.name,
-                        "chunk_index": i
-                    })
+                plan = future.result()
             except Exception as e:
-                print(f"⚠️ Error processing {file_path.name}: {e}")
-                continue
+                return (path, [], f"PDF extraction failed: {e}"), {}, {}
+            texts = plan["texts"]
+            missing = [i for i, text in enumerate(texts) if text is None]
+            state = {"texts": texts, "seconds": plan["seconds"],
+                     "cached": len(texts) - len(missing), "remaining": 0, "error": None}
+            if not missing:
+                return _pdf_loaded(path, texts, state["seconds"], state["cached"],
+                                   self.chunk_size, self.chunk_overlap, self.length_function)
+            size = max(1, min(self.pages_per_task, -(-len(missing) // workers)))
+            for start in range(0, len(missing), size):
+                page_tasks.append((path, {i: plan["keys"][i] for i in missing[start:start + size]}))
+                state["remaining"] += 1
+            in_progress[path] = state
+            return None
 
-        return docs
+        state = in_progress[path]
+        state["remaining"] -= 1
+        try:
+            extracted = future.result()
+            for index, text in extracted["texts"].items():
+                state["texts"][index] = text
+            state["seconds"] += extracted["seconds"]
+        except Exception as e:
+            state["error"] = f"PDF extraction failed: {e}"
+        if state["remaining"]:
+            return None
+        del in_progress[path]
+        if state["error"] is not None:
+            return (path, [], state["error"]), {}, {}
+        return _pdf_loaded(path, state["texts"], state["seconds"], state["cached"],
+                           self.chunk_size, self.chunk_overlap, self.length_function)
+
+    def iter_batches(self, paths: Iterable[str], batch_size: int = 256,
+                     on_file: Optional[Callable[[str, int, Optional[str]], None]] = None
+                     ) -> Iterator[List[dict]]:
+        """Yield chunk dicts from ``paths`` in lists of at most ``batch_size``.
+
+        ``on_file(path, num_chunks, error)`` is called as each file finishes;
+        failed files are reported there (or printed) and skipped.
+        """
+        batch: List[dict] = []
+        for path, docs, error in self.iter_files(paths):
+            if on_file is not None:
+                on_file(path, len(docs), error)
+            elif error is not None:
+                print(f"⚠️ Error processing {Path(path).name}: {error}")
+            for doc in docs:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
 
     def load_single_file(self, file_path: str) -> List[dict]:
         """Load a single documentation file (md/txt/pdf)."""
         try:
-            content = self._extract_text(file_path)
-            chunks = self.splitter.split_text(content)
-
-            return [
-                {
-                    "content": chunk,
-                    "source": Path(file_path).name,
-                    "chunk_index": i
-                }
-                for i, chunk in enumerate(chunks)
-            ]
+            _, docs, error = _load_file_timed(*self._job(str(file_path)))[0]
         except Exception as e:
             raise ValueError(f"Failed to load {file_path}: {str(e)}")
+        if error is not None:
+            raise ValueError(f"Failed to load {file_path}: {error}")
+        return docs
 
-    def _extract_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_text(file_path: str) -> str:
         """Extract text from different file types."""
         file_path = str(file_path)
         file_ext = Path(file_path).suffix.lower()
 
         if file_ext == ".pdf":
-            return self._extract_pdf(file_path)
+            return DocumentLoader._extract_pdf(file_path)
         elif file_ext in [".md", ".txt"]:
-            return self._extract_text_file(file_path)
+            return DocumentLoader._extract_text_file(file_path)
         else:
             raise ValueError(f"Unsupported file type: {file_ext}")
 
@@ -79,24 +637,14 @@ class DocumentLoader:
 
     @staticmethod
     def _extract_pdf(file_path: str) -> str:
-        """Extract text from PDF file."""
+        """Extract text from PDF file (pages separated by blank lines)."""
         try:
-            from pypdf import PdfReader
+            texts, _, _ = _pdf_pages(file_path, None)
         except ImportError:
-            raise ImportError("pypdf not installed. Run: pip install pypdf")
-
-        try:
-            reader = PdfReader(file_path)
-            text = ""
-
-            for page_num, page in enumerate(reader.pages):
-                text += f"\n--- Page {page_num + 1} ---\n"
-                text += page.extract_text()
-
-            if not text.strip():
-                raise ValueError("No text extracted from PDF (possibly scanned image)")
-
-            return text
-
+            raise
         except Exception as e:
-            raise ValueError(f"PDF extraction failed: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"PDF extraction failed: {str(e)}")
+        text = _join_pages(texts)[0]
+        if not text.strip():
+            raise ValueError("No text extracted from PDF (possibly scanned image)")
+        return text
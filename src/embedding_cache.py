@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+from src.embedding_pipeline import EmbeddingBatcher
+from src.telemetry import incr
+
+
+def embedding_model_name(embeddings) -> str:
+    """Best-effort identifier of the model behind a LangChain embeddings object."""
+    for attr in ("model", "model_name"):
+        name = getattr(embeddings, attr, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(embeddings).__name__
+
+
+class EmbeddingCache:
+    """Disk-backed vector cache keyed by (model, kind, sha256 of text).
+
+    Lookups go through an in-process LRU first and fall back to a SQLite
+    file, so vectors survive restarts and clear_store(). ``kind`` separates
+    query and document embeddings, which some providers compute differently.
+    """
+
+    def __init__(self, path: str, model_name: str, max_memory_items: int = 10000):
+        self.path = path
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vec BLOB NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(text: str, kind: str) -> str:
+        return f"{kind}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_items:
+            self._lru.popitem(last=False)
+
+    def get_many(self, texts: List[str], kind: str = "document") -> List[Optional[np.ndarray]]:
+        keys = [self._key(t, kind) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+                else:
+                    missing.append(key)
+
+            unique_missing = list(dict.fromkeys(missing))
+            for i in range(0, len(unique_missing), 500):
+                batch = unique_missing[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vec
+                    self._remember(key, vec)
+
+            results = [found.get(key) for key in keys]
+            hit_count = sum(r is not None for r in results)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        incr("embedding_cache_hits", hit_count)
+        incr("embedding_cache_misses", len(results) - hit_count)
+        return results
+
+    def put_many(self, texts: List[str], vectors, kind: str = "document") -> None:
+        rows = []
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                key = self._key(text, kind)
+                vec = np.asarray(vec, dtype=np.float32)
+                self._remember(key, vec)
+                rows.append((self.model_name, key, vec.tobytes()))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vec) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_items": len(self._lru),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CachedEmbeddings:
+    """LangChain-compatible embeddings wrapper that consults an EmbeddingCache.
+
+    Only texts missing from the cache reach the wrapped model. When the
+    wrapped model is an EmbeddingBatcher, each finished batch is written to
+    the cache immediately, so a failed run keeps the work already done.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.inner = embeddings
+        self.cache = cache
+
+    @property
+    def model(self) -> str:
+        return self.cache.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self.cache.get_many(texts, kind="document")
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            if isinstance(self.inner, EmbeddingBatcher):
+                vectors = self.inner.embed_documents(
+                    missing,
+                    on_batch=lambda batch, vecs: self.cache.put_many(batch, vecs, kind="document"),
+                )
+                fresh = dict(zip(missing, vectors))
+            else:
+                fresh = dict(zip(missing, self.inner.embed_documents(missing)))
+                self.cache.put_many(missing, [fresh[t] for t in missing], kind="document")
+            cached = [v if v is not None else np.asarray(fresh[t], dtype=np.float32)
+                      for t, v in zip(texts, cached)]
+        return [np.asarray(v, dtype=np.float32).tolist() for v in cached]
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.cache.get_many([text], kind="query")[0]
+        if cached is None:
+            cached = np.asarray(self.inner.embed_query(text), dtype=np.float32)
+            self.cache.put_many([text], [cached], kind="query")
+        return cached.tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # SQLite lookups run in a worker thread to keep the event loop free.
+        cached = (await asyncio.to_thread(self.cache.get_many, [text], "query"))[0]
+        if cached is None:
+            native = getattr(self.inner, "aembed_query", None)
+            if native is not None:
+                vector = await native(text)
+            else:
+                vector = await asyncio.to_thread(self.inner.embed_query, text)
+            cached = np.asarray(vector, dtype=np.float32)
+            await asyncio.to_thread(self.cache.put_many, [text], [cached], "query")
+        return cached.tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        cached = self.cache.get_many(texts, kind="query")
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            if hasattr(self.inner, "embed_queries"):
+                vectors = self.inner.embed_queries(missing)
+            else:
+                vectors = [self.inner.embed_query(t) for t in missing]
+            self.cache.put_many(missing, vectors, kind="query")
+            fresh = dict(zip(missing, vectors))
+            cached = [v if v is not None else np.asarray(fresh[t], dtype=np.float32)
+                      for t, v in zip(texts, cached)]
+        return [np.asarray(v, dtype=np.float32).tolist() for v in cached]
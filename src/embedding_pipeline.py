@@ -0,0 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional
+import asyncio
+import inspect
+import random
+import threading
+import time
+
+from src.concurrency import REMOTE_CALLS
+from src.telemetry import incr
+
+
+# Substrings of provider errors that mean "this request is too big"; such
+# batches are split in half instead of being retried as-is.
+_SIZE_ERROR_MARKERS = ("too large", "payload", "exceeds", "413", "request size")
+
+# Task type Gemini's embed_query uses; passing it to embed_documents embeds
+# a batch of queries exactly as embed_query would, in one request.
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, ``capacity`` burst."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_take(self, tokens: float) -> float:
+        """Take ``tokens`` and return 0, or return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until ``tokens`` are available, then take them."""
+        while True:
+            wait = self._try_take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1.0) -> None:
+        """``acquire`` that sleeps without blocking the event loop."""
+        while True:
+            wait = self._try_take(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class EmbeddingBatchError(RuntimeError):
+    """Some batches failed; the ones that finished were already checkpointed."""
+
+    def __init__(self, message: str, completed: int, failed: int):
+        super().__init__(message)
+        self.completed = completed
+        self.failed = failed
+
+
+class EmbeddingBatcher:
+    """Concurrent, rate-limited front end for a LangChain embeddings object.
+
+    Texts are packed into batches bounded by item count and total characters,
+    sent from a thread pool through a shared token bucket, and retried with
+    exponential backoff. Batches rejected as too large are split in half.
+    ``on_batch(texts, vectors)`` is called as each batch finishes, so a
+    caller can checkpoint results before the whole run completes.
+    """
+
+    def __init__(self, embeddings, max_workers: int = 4,
+                 requests_per_minute: float = 1500,
+                 max_batch_items: int = 100, max_batch_chars: int = 60000,
+                 max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0):
+        self.inner = embeddings
+        self.max_workers = max_workers
+        self.max_batch_items = max_batch_items
+        self.max_batch_chars = max_batch_chars
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = TokenBucket(requests_per_minute / 60.0, capacity=max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+
+    @property
+    def model(self):
+        return getattr(self.inner, "model", None) or getattr(self.inner, "model_name", None)
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        batches: List[List[int]] = []
+        current: List[int] = []
+        chars = 0
+        for i, text in enumerate(texts):
+            if current and (len(current) >= self.max_batch_items
+                            or chars + len(text) > self.max_batch_chars):
+                batches.append(current)
+                current, chars = [], 0
+            current.append(i)
+            chars += len(text)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _call(self, fn: Callable, *args):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            incr("embedding_calls")
+            try:
+                return fn(*args)
+            except Exception as e:
+                if _is_size_error(e) or attempt == self.max_retries:
+                    raise
+                incr("embedding_retries")
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                time.sleep(delay * (0.5 + random.random() / 2))
+
+    def _embed_batch(self, batch: List[str],
+                     task_type: Optional[str] = None) -> List[List[float]]:
+        incr("embedding_texts", len(batch))
+        embed = self.inner.embed_documents
+        if task_type is not None:
+            embed = partial(embed, task_type=task_type)
+        try:
+            return self._call(embed, batch)
+        except Exception as e:
+            if len(batch) > 1 and _is_size_error(e):
+                mid = len(batch) // 2
+                return (self._embed_batch(batch[:mid], task_type)
+                        + self._embed_batch(batch[mid:], task_type))
+            raise
+
+    def embed_documents(self, texts: List[str],
+                        on_batch: Optional[Callable[[List[str], List[List[float]]], None]] = None
+                        ) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = self._batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        def run(indices: List[int]) -> None:
+            batch = [texts[i] for i in indices]
+            vectors = self._embed_batch(batch)
+            if on_batch is not None:
+                on_batch(batch, vectors)
+            for i, vec in zip(indices, vectors):
+                results[i] = vec
+
+        futures = [self._pool.submit(run, indices) for indices in batches]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+
+        if errors:
+            first = errors[0]
+            raise EmbeddingBatchError(
+                f"{len(errors)} of {len(batches)} embedding batches failed "
+                f"({type(first).__name__}: {first})",
+                completed=len(batches) - len(errors),
+                failed=len(errors),
+            )
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        incr("embedding_texts")
+        return self._call(self.inner.embed_query, text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async ``embed_query``: same rate limit and retries, no thread held while waiting."""
+        native = getattr(self.inner, "aembed_query", None)
+        incr("embedding_texts")
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire()
+            incr("embedding_calls")
+            try:
+                async with REMOTE_CALLS:
+                    if native is not None:
+                        return await native(text)
+                    return await asyncio.to_thread(self.inner.embed_query, text)
+            except Exception as e:
+                if _is_size_error(e) or attempt == self.max_retries:
+                    raise
+                incr("embedding_retries")
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries in as few rate-limited requests as the provider allows.
+
+        Providers whose ``embed_documents`` takes a ``task_type`` (Gemini)
+        get the queries in batches with the query task type. Others get
+        one ``embed_query`` per text, since they may embed queries and
+        documents differently.
+        """
+        if not texts:
+            return []
+        if not _accepts_task_type(self.inner.embed_documents):
+            return list(self._pool.map(self.embed_query, texts))
+        task_type = getattr(self.inner, "task_type", None) or QUERY_TASK_TYPE
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        def run(indices: List[int]) -> None:
+            vectors = self._embed_batch([texts[i] for i in indices], task_type)
+            for i, vec in zip(indices, vectors):
+                results[i] = vec
+
+        for future in [self._pool.submit(run, indices) for indices in self._batches(texts)]:
+            future.result()
+        return results
+
+
+def _accepts_task_type(fn: Callable) -> bool:
+    try:
+        return "task_type" in inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_size_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in _SIZE_ERROR_MARKERS)
@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import os
+import threading
+
+import numpy as np
+
+from src.document_loader import DocumentLoader, file_sha256, list_documents
+from src.vector_store import VectorStoreManager, chunk_hash
+
+# Sessions share one store, so concurrent syncs must not interleave.
+_SYNC_LOCK = threading.Lock()
+
+
+class DirectoryIndexer:
+    """Keep the vector store in sync with a folder of documents.
+
+    A manifest (``files.json`` next to the store) records path, mtime, size,
+    content hash and chunk hashes for each indexed file. ``sync`` only chunks
+    and embeds files that are new or whose content changed; chunks of
+    modified or deleted files are tombstoned, and their vectors are reused
+    for any identical chunk that is still needed.
+    """
+
+    def __init__(self, vector_store: VectorStoreManager,
+                 loader: Optional[DocumentLoader] = None,
+                 manifest_name: str = "files.json", batch_size: int = 256):
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.loader = loader or DocumentLoader(
+            page_cache=os.path.join(vector_store.persist_directory, "pdf_pages.sqlite")
+        )
+        self.manifest_path = os.path.join(vector_store.persist_directory, manifest_name)
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        # A cleared store invalidates everything we remember about it.
+        if manifest.get("store_id") != self.vector_store.store_id:
+            return {}
+        return manifest.get("files", {})
+
+    def _save_manifest(self, files: Dict[str, Dict]) -> None:
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"store_id": self.vector_store.store_id, "files": files}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def sync(self, directory: str,
+             on_file: Optional[Callable[[str, int, Optional[str]], None]] = None
+             ) -> Dict[str, int]:
+        """Bring the store up to date with ``directory``.
+
+        Changed files are extracted in parallel by the loader and their new
+        chunks are embedded in batches of ``batch_size``. ``on_file(path,
+        num_chunks, error)`` reports each file as it is chunked.
+
+        Returns counts of added, updated, removed and unchanged files plus
+        the number of chunks written to the store.
+        """
+        with _SYNC_LOCK:
+            return self._sync(directory, on_file)
+
+    def _sync(self, directory: str, on_file=None) -> Dict[str, int]:
+        files = self._load_manifest()
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "chunks": 0}
+
+        current: Dict[str, Path] = {p.name: p for p in list_documents(directory)}
+
+        to_index: List[Tuple[str, Path, Dict]] = []
+        for name, file_path in sorted(current.items()):
+            st = file_path.stat()
+            entry = files.get(name)
+            if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+                stats["unchanged"] += 1
+                continue
+            sha = file_sha256(str(file_path))
+            if entry and entry["sha256"] == sha:
+                entry.update(mtime=st.st_mtime, size=st.st_size, path=str(file_path))
+                stats["unchanged"] += 1
+                continue
+            to_index.append((name, file_path, {
+                "path": str(file_path),
+                "mtime": st.st_mtime,
+                "size": st.st_size,
+                "sha256": sha,
+            }))
+
+        # Tombstone chunks of removed and modified files, keeping their
+        # vectors around so unchanged chunks are not re-embedded.
+        pool: Dict[int, Tuple[str, np.ndarray]] = {}
+        stale = [name for name in files if name not in current]
+        stale += [name for name, _, _ in to_index if name in files]
+        for name in stale:
+            docs, vectors = self.vector_store.export_source(name)
+            for doc, vec in zip(docs, vectors):
+                pool[chunk_hash(doc["content"])] = (doc["content"], vec)
+            self.vector_store.delete_source(name)
+            if name not in current:
+                del files[name]
+                stats["removed"] += 1
+
+        pending: List[dict] = []
+        by_path = {str(file_path): (name, entry) for name, file_path, entry in to_index}
+        for path, docs, error in self.loader.iter_files(by_path):
+            name, entry = by_path[path]
+            if on_file is not None:
+                on_file(path, len(docs), error)
+            if error is not None:
+                print(f"⚠️ Error processing {name}: {error}")
+                files.pop(name, None)
+                continue
+            docs = [d for d in docs if (d.get("content") or "").strip()]
+            hashes = [chunk_hash(d["content"].strip()) for d in docs]
+
+            reused = [i for i, h in enumerate(hashes) if h in pool]
+            if reused:
+                stats["chunks"] += self.vector_store.add_documents(
+                    [docs[i] for i in reused],
+                    vectors=np.stack([pool[hashes[i]][1] for i in reused]),
+                )
+            # New chunks are embedded in bounded batches across files.
+            pending.extend(docs[i] for i, h in enumerate(hashes) if h not in pool)
+            while len(pending) >= self.batch_size:
+                stats["chunks"] += self.vector_store.add_documents(pending[:self.batch_size])
+                del pending[:self.batch_size]
+
+            stats["updated" if name in files else "added"] += 1
+            entry["chunks"] = hashes
+            files[name] = entry
+        if pending:
+            stats["chunks"] += self.vector_store.add_documents(pending)
+
+        self._save_manifest(files)
+        return stats
@@ -0,0 +1,239 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+
+from src.ann_index import top_k
+from src.segment_store import SegmentStore
+
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; identifiers also yield their parts.
+
+    ``getUserById`` gives ``getuserbyid, get, user, by, id`` and
+    ``ERR_CONN_RESET`` gives ``err_conn_reset, err, conn, reset``, so both
+    exact identifiers and their pieces match.
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def term_id(token: str) -> int:
+    """Stable 64-bit id of a token (posting lists store ids, not strings)."""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], k: int = 60) -> List[Tuple[object, float]]:
+    """Fuse ranked id lists: score(id) = sum of 1 / (k + rank), best first."""
+    scores: Dict[object, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class LexicalIndex:
+    """BM25 inverted index over the texts of a SegmentStore.
+
+    Each segment gets a ``<segment>.bm25.npz`` sidecar with its posting
+    lists (term ids, local rows and term frequencies, sorted by term) and
+    document lengths. Sidecars are written when rows are appended and built
+    on first use for segments that predate the index. In memory, all
+    postings are merged into one term-sorted array, so a lookup is a
+    binary search plus a slice per query term; an appended segment is
+    merged into it in linear time.
+
+    Tombstoned rows are skipped at query time and excluded from the
+    document frequencies.
+    """
+
+    SUFFIX = ".bm25.npz"
+
+    def __init__(self, store: SegmentStore, k1: float = 1.2, b: float = 0.75):
+        self.store = store
+        self.k1 = k1
+        self.b = b
+        self._parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._doclen = np.empty(0, dtype=np.int32)
+        self._postings: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._loaded = False
+        # Searches run concurrently under the store's read lock.
+        self._load_lock = threading.Lock()
+
+    # -- building ------------------------------------------------------
+    @staticmethod
+    def _segment_postings(texts: Iterable[str]):
+        terms, rows, tfs, doclen = [], [], [], []
+        for local, text in enumerate(texts):
+            tokens = tokenize(text)
+            doclen.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                terms.append(term_id(token))
+                rows.append(local)
+                tfs.append(tf)
+        terms = np.array(terms, dtype=np.uint64)
+        order = np.argsort(terms, kind="stable")
+        return {
+            "terms": terms[order],
+            "rows": np.array(rows, dtype=np.int32)[order],
+            "tfs": np.array(tfs, dtype=np.int32)[order],
+            "doclen": np.array(doclen, dtype=np.int32),
+        }
+
+    def _load_segment(self, rows: range, prefix: str, texts: Optional[List[str]] = None):
+        path = prefix + self.SUFFIX
+        if os.path.exists(path):
+            with np.load(path) as data:
+                part = {name: data[name] for name in data.files}
+        else:
+            if texts is None:
+                texts = [self.store.record(row)[0] for row in rows]
+            part = self._segment_postings(texts)
+            with open(path, "wb") as f:
+                np.savez(f, **part)
+        new = (part["terms"], part["rows"].astype(np.int64) + rows.start, part["tfs"])
+        self._parts.append(new)
+        self._doclen = np.concatenate([self._doclen, part["doclen"]])
+        if self._postings is not None:
+            # Both sides are term-sorted: one linear insert, no re-sort.
+            # side="right" keeps the new (higher) rows after existing ones.
+            at = np.searchsorted(self._postings[0], new[0], side="right")
+            self._postings = tuple(np.insert(old, at, added)
+                                   for old, added in zip(self._postings, new))
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                for rows, prefix in self.store.segment_ranges():
+                    self._load_segment(rows, prefix)
+                self._loaded = True
+
+    def add(self, rows: range, texts: List[str]) -> None:
+        """Index rows just appended to the store (they form one segment)."""
+        if len(rows) == 0:
+            return
+        prefix = next(p for r, p in self.store.segment_ranges() if r.start == rows.start)
+        if not self._loaded:
+            # Write the sidecar now; everything is read on the first search.
+            if not os.path.exists(prefix + self.SUFFIX):
+                with open(prefix + self.SUFFIX, "wb") as f:
+                    np.savez(f, **self._segment_postings(texts))
+            return
+        self._load_segment(rows, prefix, texts)
+
+    def reset(self) -> None:
+        """Called after the store was cleared (sidecars went with the segments)."""
+        self._parts = []
+        self._doclen = np.empty(0, dtype=np.int32)
+        self._postings = None
+        self._loaded = False
+
+    def rewrite_segment(self, parts: List[Tuple[str, np.ndarray]], new_prefix: str) -> None:
+        """Carry sidecars over to a compacted or merged segment.
+
+        ``parts`` lists ``(old_prefix, keep)`` for the old segments in row
+        order, ``keep`` being the local rows kept. If any of them has no
+        sidecar, the new segment is indexed on first use as usual.
+        Call ``reset()`` once compaction is done.
+        """
+        if not all(os.path.exists(prefix + self.SUFFIX) for prefix, _ in parts):
+            return
+        terms, rows, tfs, doclen = [], [], [], []
+        offset = 0
+        for prefix, keep in parts:
+            with np.load(prefix + self.SUFFIX) as data:
+                part = {name: data[name] for name in data.files}
+            renumber = np.cumsum(keep) - 1 + offset
+            kept = keep[part["rows"]]
+            terms.append(part["terms"][kept])
+            rows.append(renumber[part["rows"][kept]])
+            tfs.append(part["tfs"][kept])
+            doclen.append(part["doclen"][keep])
+            offset += int(keep.sum())
+        terms = np.concatenate(terms)
+        # Stable: within a term, rows stay ascending across the parts.
+        order = np.argsort(terms, kind="stable")
+        with open(new_prefix + self.SUFFIX, "wb") as f:
+            np.savez(
+                f,
+                terms=terms[order],
+                rows=np.concatenate(rows)[order].astype(np.int32),
+                tfs=np.concatenate(tfs)[order],
+                doclen=np.concatenate(doclen),
+            )
+
+    def _merged(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        postings = self._postings
+        if postings is None:
+            terms = np.concatenate([p[0] for p in self._parts]) if self._parts else np.empty(0, np.uint64)
+            rows = np.concatenate([p[1] for p in self._parts]) if self._parts else np.empty(0, np.int64)
+            tfs = np.concatenate([p[2] for p in self._parts]) if self._parts else np.empty(0, np.int32)
+            order = np.argsort(terms, kind="stable")
+            postings = self._postings = (terms[order], rows[order], tfs[order])
+        return postings
+
+    # -- querying ------------------------------------------------------
+    def search(self, query: str, k: int,
+               live: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """BM25 top-k over live rows.
+
+        Returns ``(rows, scores, coverage)``: coverage is the idf-weighted
+        share of the query terms each hit contains (1.0 = all of them).
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32),
+                 np.empty(0, dtype=np.float32))
+        query_terms = np.unique(np.array([term_id(t) for t in tokenize(query)], dtype=np.uint64))
+        if len(query_terms) == 0:
+            return empty
+        self._ensure_loaded()
+        terms, rows, tfs = self._merged()
+        n_docs = int(live.sum())
+        if n_docs == 0 or len(terms) == 0:
+            return empty
+        doclen = self._doclen[:len(live)]
+        avgdl = max(float(doclen[live].mean()), 1.0)
+
+        lo = np.searchsorted(terms, query_terms, side="left")
+        hi = np.searchsorted(terms, query_terms, side="right")
+        hit_rows, weights, idf_hits, idf_total = [], [], [], 0.0
+        for start, stop in zip(lo, hi):
+            r = rows[start:stop]
+            keep = live[r]
+            r = r[keep]
+            df = len(r)
+            idf = float(np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+            idf_total += idf
+            if df == 0:
+                continue
+            tf = tfs[start:stop][keep].astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * doclen[r] / avgdl)
+            hit_rows.append(r)
+            weights.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+            idf_hits.append(np.full(df, idf, dtype=np.float32))
+        if not hit_rows:
+            return empty
+
+        candidates, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+        covered = np.bincount(inverse, weights=np.concatenate(idf_hits)).astype(np.float32)
+        top = top_k(scores, k)
+        coverage = covered[top] / max(idf_total, 1e-8)
+        return candidates[top], scores[top], coverage
@@ -1,12 +1,24 @@
 import os
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from typing import Dict
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import time
 
+from src.answer_cache import AnswerCache
+from src.concurrency import REMOTE_CALLS
+from src.context_builder import estimate_tokens
+from src.telemetry import TELEMETRY, incr, span
 
-load_dotenv()
+# LangChain and the Gemini SDK take seconds to import; they are loaded on
+# the first LLM call instead of at startup.
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    from dotenv import load_dotenv
+    load_dotenv()
 
 
 # Support Streamlit Cloud secrets
@@ -19,22 +31,24 @@ def get_api_key():
             return st.secrets["GOOGLE_API_KEY"]
     except:
         pass
+    _load_env()
     return os.getenv("GOOGLE_API_KEY")
 
 
-class CodeWhispererChain:
-    """LangChain integration for CodeWhisperer using FREE Gemini."""
+@lru_cache(maxsize=32)
+def shared_llm(model: str, temperature: float) -> "ChatGoogleGenerativeAI":
+    """One chat client per (model, temperature) for the whole process."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=model, temperature=temperature, api_key=get_api_key(), max_tokens=1500
+    )
 
-    def __init__(self, model: str = "gemini-2.0-flash", temperature: float = 0.3):
-        self.llm = ChatGoogleGenerativeAI(
-            model=model, temperature=temperature, api_key=get_api_key(), max_tokens=1500
-        )
 
-        self.prompt_template = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    """You are an AI assistant that answers questions using the provided documents.
+PROMPT_MESSAGES = [
+    (
+        "system",
+        """You are an AI assistant that answers questions using the provided documents.
 
 POLICY:
 1. Base answers only on the given context; do not fabricate details.
@@ -43,10 +57,10 @@ POLICY:
 4. If the context is insufficient, say so and suggest what is missing.
 5. Keep responses concise and directly address the user's question.
 6. Do not add citations inline; the app will show sources separately.""",
-                ),
-                (
-                    "user",
-                    """CONTEXT:
+    ),
+    (
+        "user",
+        """CONTEXT:
 {context}
 
 ---
@@ -58,19 +72,198 @@ QUESTION:
 
 RESPONSE (neutral, third-person; avoid using "I" or "me"):
 """,
-                ),
-            ]
-        )
+    ),
+]
+
+
+# System prompt and template text sent with every question.
+_PROMPT_TOKENS = estimate_tokens("".join(text for _, text in PROMPT_MESSAGES))
+
+
+@lru_cache(maxsize=1)
+def _prompt_template():
+    from langchain.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_messages(PROMPT_MESSAGES)
+
+
+class CodeWhispererChain:
+    """LangChain integration for CodeWhisperer using FREE Gemini.
+
+    Construction is cheap: the chat client and prompt are built on first use.
+    Any LangChain chat model can be passed as ``llm`` instead (e.g. a stub
+    for benchmarks).
+    """
+
+    def __init__(self, model: str = "gemini-2.0-flash", temperature: float = 0.3,
+                 answer_cache: Optional[AnswerCache] = None, llm=None):
+        self.model = model
+        self.temperature = temperature
+        self._llm = llm
+        # Optional; cache hits skip the Gemini call entirely.
+        self.answer_cache = answer_cache
+
+    @property
+    def llm(self) -> "ChatGoogleGenerativeAI":
+        if self._llm is None:
+            self._llm = shared_llm(self.model, self.temperature)
+        return self._llm
+
+    @property
+    def prompt_template(self):
+        return _prompt_template()
+
+    def _chain(self):
+        from langchain_core.output_parsers import StrOutputParser
+
+        return self.prompt_template | self.llm | StrOutputParser()
 
     def invoke(self, context: str, question: str) -> Dict:
-        chain = self.prompt_template | self.llm | StrOutputParser()
+        chain = self._chain()
 
-        response = chain.invoke({"context": context, "question": question})
+        with span("llm_total", model=self.model):
+            response = chain.invoke({"context": context, "question": question})
+        self._count_tokens(context, question, response)
+
+        return {"answer": response, "model": getattr(self.llm, "model_name", "gemini")}
+
+    async def ainvoke(self, context: str, question: str) -> Dict:
+        """Async ``invoke``; counts against the process-wide REMOTE_CALLS limit."""
+        async with REMOTE_CALLS:
+            with span("llm_total", model=self.model):
+                response = await self._chain().ainvoke({"context": context, "question": question})
+        self._count_tokens(context, question, response)
 
         return {"answer": response, "model": getattr(self.llm, "model_name", "gemini")}
 
     def invoke_with_retriever(self, retriever, question: str) -> Dict:
         context, sources = retriever.retrieve_context(question)
+        cached = self._cached_answer(retriever, question, sources)
+        if cached is not None:
+            return cached
         result = self.invoke(context, question)
+        self._remember_answer(retriever, question, sources, result)
+        result["sources"] = sources
+        return result
+
+    async def ainvoke_with_retriever(self, retriever, question: str) -> Dict:
+        """Async ``invoke_with_retriever``: no thread is held while Gemini responds.
+
+        Many questions can be awaited concurrently (e.g. with
+        ``asyncio.gather``); remote calls are capped by REMOTE_CALLS.
+        """
+        context, sources = await retriever.aretrieve_context(question)
+        cached = await asyncio.to_thread(self._cached_answer, retriever, question, sources)
+        if cached is not None:
+            return cached
+        result = await self.ainvoke(context, question)
+        await asyncio.to_thread(self._remember_answer, retriever, question, sources, result)
         result["sources"] = sources
         return result
+
+    def _cached_answer(self, retriever, question: str, sources: List[dict]) -> Optional[Dict]:
+        if self.answer_cache is None:
+            return None
+        store = retriever.vector_store
+        # Semantic matching only when retrieval already embedded the
+        # question; otherwise the exact layer alone must not cost a call.
+        vector = store.query_vector_if_known(question)
+        result = self.answer_cache.lookup(
+            question,
+            [s.get("chunk_id") for s in sources],
+            embed=(lambda: vector) if vector is not None else None,
+            store_id=store.store_id,
+        )
+        if result is not None:
+            result.update(sources=sources, cached=True)
+        return result
+
+    def _remember_answer(self, retriever, question: str, sources: List[dict],
+                         result: Dict) -> None:
+        if self.answer_cache is None:
+            return
+        store = retriever.vector_store
+        self.answer_cache.store(
+            question,
+            [s.get("chunk_id") for s in sources],
+            {k: v for k, v in result.items() if k != "sources"},
+            vector=store.query_vector_if_known(question),
+            store_id=store.store_id,
+        )
+
+    def _count_tokens(self, context: str, question: str, answer: str) -> None:
+        # Estimates: the chain's output parser drops the provider's usage data.
+        incr("llm_calls")
+        incr("llm_prompt_tokens", _PROMPT_TOKENS + estimate_tokens(context) + estimate_tokens(question))
+        incr("llm_completion_tokens", estimate_tokens(answer))
+
+    def stream(self, context: str, question: str) -> Iterator[str]:
+        """Yield answer text chunks as the model produces them."""
+        start = time.perf_counter()
+        parts = []
+        for token in self._chain().stream({"context": context, "question": question}):
+            if not parts:
+                TELEMETRY.observe("llm_first_token", time.perf_counter() - start, model=self.model)
+            parts.append(token)
+            yield token
+        TELEMETRY.observe("llm_total", time.perf_counter() - start, model=self.model)
+        self._count_tokens(context, question, "".join(parts))
+
+    async def astream(self, context: str, question: str) -> AsyncIterator[str]:
+        """Async variant of ``stream``; holds a REMOTE_CALLS slot while streaming."""
+        async with REMOTE_CALLS:
+            start = time.perf_counter()
+            parts = []
+            async for token in self._chain().astream({"context": context, "question": question}):
+                if not parts:
+                    TELEMETRY.observe("llm_first_token", time.perf_counter() - start,
+                                      model=self.model)
+                parts.append(token)
+                yield token
+            TELEMETRY.observe("llm_total", time.perf_counter() - start, model=self.model)
+        self._count_tokens(context, question, "".join(parts))
+
+    def stream_with_retriever(self, retriever, question: str) -> Tuple[List[dict], Iterator[str]]:
+        """Retrieve first, then return ``(sources, token_iterator)``.
+
+        Sources are available before generation starts, so the UI can show
+        them while the answer streams in.
+        """
+        context, sources = retriever.retrieve_context(question)
+        cached = self._cached_answer(retriever, question, sources)
+        if cached is not None:
+            return sources, iter([cached["answer"]])
+
+        def tokens() -> Iterator[str]:
+            parts = []
+            for token in self.stream(context, question):
+                parts.append(token)
+                yield token
+            self._remember_answer(retriever, question, sources, {
+                "answer": "".join(parts),
+                "model": getattr(self.llm, "model_name", "gemini"),
+            })
+
+        return sources, tokens()
+
+    async def astream_with_retriever(self, retriever,
+                                     question: str) -> Tuple[List[dict], AsyncIterator[str]]:
+        """Async variant of ``stream_with_retriever``."""
+        context, sources = await retriever.aretrieve_context(question)
+        cached = await asyncio.to_thread(self._cached_answer, retriever, question, sources)
+        if cached is not None:
+            async def replay() -> AsyncIterator[str]:
+                yield cached["answer"]
+            return sources, replay()
+
+        async def tokens() -> AsyncIterator[str]:
+            parts = []
+            async for token in self.astream(context, question):
+                parts.append(token)
+                yield token
+            await asyncio.to_thread(self._remember_answer, retriever, question, sources, {
+                "answer": "".join(parts),
+                "model": getattr(self.llm, "model_name", "gemini"),
+            })
+
+        return sources, tokens()
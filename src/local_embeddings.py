@@ -0,0 +1,133 @@
+from typing import List, Optional, Tuple
+import os
+
+import numpy as np
+
+from src.telemetry import incr
+
+
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def resolve_model_files(model_name: str, model_dir: Optional[str]) -> Tuple[str, str]:
+    """Paths of ``model.onnx`` and ``tokenizer.json`` in ``model_dir``, else from the Hub."""
+    if model_dir:
+        for candidate in ("model.onnx", os.path.join("onnx", "model.onnx")):
+            if os.path.exists(os.path.join(model_dir, candidate)):
+                return (os.path.join(model_dir, candidate),
+                        os.path.join(model_dir, "tokenizer.json"))
+        raise FileNotFoundError(f"No model.onnx found in {model_dir}")
+    try:
+        from huggingface_hub import hf_hub_download
+    except ImportError:
+        raise ImportError(
+            "Set a local model directory or run: pip install huggingface_hub"
+        )
+    return (hf_hub_download(model_name, "onnx/model.onnx"),
+            hf_hub_download(model_name, "tokenizer.json"))
+
+
+def length_batches(lengths: List[int], max_batch_tokens: int) -> List[np.ndarray]:
+    """Index batches of similar length, each under ``max_batch_tokens`` once padded."""
+    order = np.argsort(lengths, kind="stable")
+    batches, current = [], []
+    for i in order:
+        # Ascending order: the newest item is the longest in its batch.
+        if current and lengths[i] * (len(current) + 1) > max_batch_tokens:
+            batches.append(np.array(current))
+            current = []
+        current.append(i)
+    if current:
+        batches.append(np.array(current))
+    return batches
+
+
+def encoding_arrays(encodings) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Zero-padded ``(input_ids, attention_mask, token_type_ids)`` of tokenizer encodings."""
+    width = max(len(e.ids) for e in encodings)
+    ids = np.zeros((len(encodings), width), dtype=np.int64)
+    mask = np.zeros_like(ids)
+    types = np.zeros_like(ids)
+    for row, e in enumerate(encodings):
+        ids[row, :len(e.ids)] = e.ids
+        mask[row, :len(e.ids)] = e.attention_mask
+        types[row, :len(e.ids)] = e.type_ids
+    return ids, mask, types
+
+
+class LocalEmbeddings:
+    """Offline sentence embeddings with ONNX Runtime (no torch).
+
+    Loads ``model.onnx`` and ``tokenizer.json`` from ``model_dir``, or
+    fetches them from the Hugging Face Hub for ``model_name`` when no
+    directory is given. Texts are sorted by token length and packed into
+    batches of at most ``max_batch_tokens`` padded tokens, so short texts
+    are not padded to the length of long ones. Outputs are mean-pooled over
+    the attention mask and L2-normalized, as sentence-transformers does.
+
+    Requires ``onnxruntime`` and ``tokenizers`` (plus ``huggingface_hub``
+    for downloads): ``pip install onnxruntime tokenizers huggingface_hub``.
+    """
+
+    # Runs in-process: VectorStoreManager skips the remote-API batcher.
+    local = True
+
+    def __init__(self, model_name: str = DEFAULT_LOCAL_MODEL,
+                 model_dir: Optional[str] = None, max_length: int = 256,
+                 max_batch_tokens: int = 8192, threads: Optional[int] = None):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError(
+                "Local embeddings need onnxruntime and tokenizers. "
+                "Run: pip install onnxruntime tokenizers huggingface_hub"
+            )
+
+        self.model = model_name
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+
+        model_path, tokenizer_path = resolve_model_files(
+            model_name, model_dir or os.getenv("LOCAL_EMBEDDING_MODEL_DIR")
+        )
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _run(self, encodings) -> np.ndarray:
+        ids, mask, types = encoding_arrays(encodings)
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": types}
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        incr("embedding_texts", len(texts))
+        encodings = self.tokenizer.encode_batch(list(texts))
+        out: Optional[np.ndarray] = None
+        for batch in length_batches([len(e.ids) for e in encodings], self.max_batch_tokens):
+            incr("embedding_calls")
+            vectors = self._run([encodings[i] for i in batch])
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[batch] = vectors
+        return out.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Symmetric model: queries and documents share one batched pass.
+        return self.embed_documents(texts)
@@ -0,0 +1,70 @@
+from typing import Dict, List, Optional, Sequence
+import json
+import sqlite3
+import threading
+
+
+class PageCache:
+    """SQLite cache of text extracted from PDF pages.
+
+    Pages are keyed by a hash of their content stream and resources (fonts
+    with their encodings, Form XObjects), so after a small edit only the
+    changed pages are extracted again. A second
+    table maps a file's sha256 to its page keys, so an unchanged file is
+    served without parsing the PDF at all. Worker processes open their own
+    connection to the same file; WAL mode lets them read and write
+    concurrently.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, text TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files (sha256 TEXT PRIMARY KEY, pages TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        found: Dict[str, str] = {}
+        with self._lock:
+            # SQLite caps the number of bound parameters per statement.
+            for start in range(0, len(keys), 500):
+                block = list(keys[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, text FROM pages WHERE key IN ({','.join('?' * len(block))})",
+                    block,
+                ).fetchall()
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, pages: Dict[str, str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (key, text) VALUES (?, ?)", list(pages.items())
+            )
+            self._conn.commit()
+
+    def file_pages(self, sha256: str) -> Optional[List[str]]:
+        """Page keys recorded for a file, or None if it was never seen."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pages FROM files WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_file(self, sha256: str, keys: List[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (sha256, pages) VALUES (?, ?)",
+                (sha256, json.dumps(keys)),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,86 @@
+from typing import Dict, Optional
+import numpy as np
+
+from src.segment_store import SegmentStore
+
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetric per-row int8 codes and float32 scales (x ~= codes * scale)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scale = np.abs(vectors).max(axis=1) / 127.0
+    scale = np.maximum(scale, 1e-12).astype(np.float32)
+    codes = np.rint(vectors / scale[:, None]).astype(np.int8)
+    return codes, scale
+
+
+def quantized_columns(vectors: np.ndarray, kind: str) -> Dict[str, np.ndarray]:
+    """Per-segment column files holding the compact copy of ``vectors``."""
+    if kind == "float16":
+        return {"f16": np.asarray(vectors, dtype=np.float16)}
+    if kind == "int8":
+        codes, scale = quantize_int8(vectors)
+        return {"i8": codes, "i8scale": scale}
+    return {}
+
+
+class CompactMatrix:
+    """In-memory float16 / int8 copy of a SegmentStore's vectors.
+
+    Used for a cheap first scoring pass; callers rescore the best
+    candidates against the exact float32 rows. The compact columns are
+    saved next to each segment, and older segments are converted on first use.
+
+    int8 cuts the matrix 4x and scores about as fast as float32. float16
+    halves it, but NumPy widens half floats in software, so it trades query
+    latency for memory (see benchmarks/bench_quant.py).
+    """
+
+    def __init__(self, store: SegmentStore, kind: str, block_rows: int = 1024):
+        if kind not in ("float16", "int8"):
+            raise ValueError(f"Unsupported quantization {kind!r}")
+        self.store = store
+        self.kind = kind
+        self.block_rows = block_rows
+
+    def _matrix(self):
+        if self.kind == "float16":
+            codes = self.store.column(
+                "f16", np.float16,
+                from_vectors=lambda v: quantized_columns(v, "float16")["f16"],
+            )
+            return codes, None
+        codes = self.store.column(
+            "i8", np.int8, from_vectors=lambda v: quantize_int8(v)[0]
+        )
+        scale = self.store.column(
+            "i8scale", np.float32, from_vectors=lambda v: quantize_int8(v)[1]
+        )
+        return codes, scale
+
+    @property
+    def nbytes(self) -> int:
+        codes, scale = self._matrix()
+        return codes.nbytes + (scale.nbytes if scale is not None else 0)
+
+    def scores(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate cosine scores for all rows, or only for ``rows``.
+
+        ``q`` may also be a (dim, n_queries) matrix; the result then has one
+        column per query.
+        """
+        codes, scale = self._matrix()
+        if scale is not None and q.ndim == 2:
+            scale = scale[:, None]
+        if rows is not None:
+            out = codes[rows].astype(np.float32) @ q
+            return out * scale[rows] if scale is not None else out
+
+        # Widen in cache-sized blocks so the full matrix is never copied.
+        out = np.empty((len(codes),) + q.shape[1:], dtype=np.float32)
+        for start in range(0, len(codes), self.block_rows):
+            block = codes[start:start + self.block_rows]
+            out[start:start + len(block)] = block.astype(np.float32) @ q
+        return out * scale if scale is not None else out
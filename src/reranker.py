@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.lexical_index import tokenize
+from src.local_embeddings import encoding_arrays, length_batches, resolve_model_files
+from src.telemetry import incr, span
+
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+Result = Tuple[str, dict, float]
+
+
+class TermOverlapScorer:
+    """Deterministic scorer: the share of query tokens that occur in the text.
+
+    Needs no model and always ranks the same way, so tests and benchmarks
+    can exercise reranking. ``latency`` / ``per_pair`` seconds are slept per
+    call to stand in for a model's cost.
+    """
+
+    name = "term-overlap"
+
+    def __init__(self, latency: float = 0.0, per_pair: float = 0.0):
+        self.latency = latency
+        self.per_pair = per_pair
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        time.sleep(self.latency + self.per_pair * len(pairs))
+        queries: Dict[str, set] = {}
+        scores = []
+        for query, text in pairs:
+            terms = queries.get(query)
+            if terms is None:
+                terms = queries[query] = set(tokenize(query))
+            scores.append(len(terms.intersection(tokenize(text))) / len(terms) if terms else 0.0)
+        return scores
+
+
+class CrossEncoderScorer:
+    """Local cross-encoder on ONNX Runtime: reads query and chunk together.
+
+    Loads ``model.onnx`` and ``tokenizer.json`` from ``model_dir`` (or
+    ``RERANKER_MODEL_DIR``), else downloads ``model_name`` from the Hugging
+    Face Hub. Pairs are packed into length-sorted batches of at most
+    ``max_batch_tokens`` padded tokens; logits are mapped to 0..1 with a
+    sigmoid, as sentence-transformers' CrossEncoder does.
+
+    Requires ``onnxruntime`` and ``tokenizers`` (plus ``huggingface_hub``
+    for downloads).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL,
+                 model_dir: Optional[str] = None, max_length: int = 512,
+                 max_batch_tokens: int = 16384, threads: Optional[int] = None):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError(
+                "Reranking needs onnxruntime and tokenizers. "
+                "Run: pip install onnxruntime tokenizers huggingface_hub"
+            )
+
+        self.name = model_name
+        self.max_batch_tokens = max_batch_tokens
+        model_path, tokenizer_path = resolve_model_files(
+            model_name, model_dir or os.getenv("RERANKER_MODEL_DIR")
+        )
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        encodings = self.tokenizer.encode_batch(list(pairs))
+        out = np.empty(len(pairs), dtype=np.float32)
+        for batch in length_batches([len(e.ids) for e in encodings], self.max_batch_tokens):
+            ids, mask, types = encoding_arrays([encodings[i] for i in batch])
+            feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": types}
+            logits = self.session.run(
+                None, {k: v for k, v in feeds.items() if k in self._input_names}
+            )[0]
+            out[batch] = np.asarray(logits, dtype=np.float32).reshape(len(batch), -1)[:, 0]
+        return (1.0 / (1.0 + np.exp(-out))).tolist()
+
+
+class Reranker:
+    """Second retrieval stage: rescores candidate chunks against the query.
+
+    ``scorer`` is any object with ``score(pairs) -> scores`` over
+    ``(query, chunk text)`` pairs and a ``name`` (CrossEncoderScorer by
+    default, TermOverlapScorer for deterministic runs). Pairs from all
+    queries of a call are scored together in batches of ``batch_size``,
+    and scores are kept in an LRU of ``cache_size`` entries keyed by query
+    and chunk id, so repeated questions skip the model. The returned
+    results carry the reranker's score in place of the retrieval score.
+    """
+
+    def __init__(self, scorer=None, batch_size: int = 32, cache_size: int = 20000):
+        self.scorer = scorer if scorer is not None else CrossEncoderScorer()
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str, text: str, meta: dict) -> Tuple[str, str]:
+        chunk_id = meta.get("chunk_id") or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return query, chunk_id
+
+    def rerank(self, query: str, results: List[Result], k: int) -> List[Result]:
+        return self.rerank_many([query], [results], k)[0]
+
+    def rerank_many(self, queries: List[str], batches: List[List[Result]],
+                    k: int) -> List[List[Result]]:
+        """Best ``k`` of each query's candidates by reranker score."""
+        with span("rerank", queries=len(queries), candidates=sum(len(b) for b in batches)):
+            scores: Dict[Tuple[str, str], float] = {}
+            missing: Dict[Tuple[str, str], Tuple[str, str]] = {}
+            with self._lock:
+                for query, results in zip(queries, batches):
+                    for text, meta, _ in results:
+                        key = self._key(query, text, meta)
+                        if key in scores or key in missing:
+                            continue
+                        cached = self._cache.get(key)
+                        if cached is None:
+                            missing[key] = (query, text)
+                        else:
+                            self._cache.move_to_end(key)
+                            scores[key] = cached
+                self.hits += len(scores)
+                self.misses += len(missing)
+            incr("rerank_cache_hits", len(scores))
+            incr("rerank_cache_misses", len(missing))
+
+            keys = list(missing)
+            for start in range(0, len(keys), self.batch_size):
+                block = keys[start:start + self.batch_size]
+                incr("rerank_batches")
+                values = self.scorer.score([missing[key] for key in block])
+                scores.update(zip(block, (float(v) for v in values)))
+            if keys:
+                with self._lock:
+                    for key in keys:
+                        self._cache[key] = scores[key]
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+            reranked = []
+            for query, results in zip(queries, batches):
+                rescored = [(text, meta, scores[self._key(query, text, meta)])
+                            for text, meta, _ in results]
+                # Stable sort: ties keep their retrieval order.
+                rescored.sort(key=lambda r: -r[2])
+                reranked.append(rescored[:k])
+            return reranked
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
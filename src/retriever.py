@@ -1,32 +1,103 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+from src.context_builder import ContextBuilder
+from src.reranker import Reranker
+from src.telemetry import span
 from src.vector_store import VectorStoreManager
 
 
 class RAGRetriever:
-    """Handles retrieval-augmented generation pipeline."""
+    """Handles retrieval-augmented generation pipeline.
+
+    ``mode`` picks the ranking: ``"vector"`` (cosine), ``"lexical"`` (BM25)
+    or ``"hybrid"`` (both, fused by reciprocal rank). ``where`` limits
+    retrieval to matching chunks, e.g. ``{"source": ["a.pdf", "b.md"]}`` or
+    ``{"file_type": "pdf"}`` (see ``VectorStoreManager._filter_rows``).
+
+    With a ``reranker``, retrieval over-fetches ``candidates`` chunks and
+    the reranker picks the final ``k``, so fewer, better chunks reach the
+    prompt.
+
+    Retrieved chunks are assembled by a ContextBuilder, which merges
+    neighbouring chunks and keeps the context within a token budget.
+    """
 
-    def __init__(self, vector_store_manager: VectorStoreManager, k: int = 3):
+    MODES = ("vector", "lexical", "hybrid")
+
+    def __init__(self, vector_store_manager: VectorStoreManager, k: int = 3,
+                 mode: str = "vector", where: Optional[Dict] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 reranker: Optional[Reranker] = None, candidates: int = 50):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {self.MODES}")
         self.vector_store = vector_store_manager
         self.k = k
+        self.mode = mode
+        self.where = where
+        self.context_builder = context_builder or ContextBuilder()
+        self.reranker = reranker
+        self.candidates = candidates
+
+    @property
+    def fetch_k(self) -> int:
+        """Chunks taken from the first stage (over-fetched when reranking)."""
+        return max(self.k, self.candidates) if self.reranker is not None else self.k
+
+    def search(self, query: str, where: Optional[Dict] = None) -> List[Tuple[str, dict, float]]:
+        where = where if where is not None else self.where
+        k = self.fetch_k
+        if self.mode == "hybrid":
+            results = self.vector_store.hybrid_search(query, k=k, where=where)
+        elif self.mode == "lexical":
+            results = self.vector_store.lexical_search(query, k=k, where=where)
+        else:
+            results = self.vector_store.search(query, k=k, where=where)
+        if self.reranker is None:
+            return results
+        return self.reranker.rerank(query, results, self.k)
+
+    async def asearch(self, query: str,
+                      where: Optional[Dict] = None) -> List[Tuple[str, dict, float]]:
+        """Async ``search``; only the embedding call is awaited on the event loop."""
+        where = where if where is not None else self.where
+        k = self.fetch_k
+        if self.mode == "hybrid":
+            results = await self.vector_store.ahybrid_search(query, k=k, where=where)
+        elif self.mode == "lexical":
+            results = await asyncio.to_thread(self.vector_store.lexical_search, query, k, where)
+        else:
+            results = await self.vector_store.asearch(query, k=k, where=where)
+        if self.reranker is None:
+            return results
+        return await asyncio.to_thread(self.reranker.rerank, query, results, self.k)
 
-    def retrieve_context(self, query: str) -> Tuple[str, List[dict]]:
-        results = self.vector_store.search(query, k=self.k)
+    def retrieve_context(self, query: str,
+                         where: Optional[Dict] = None) -> Tuple[str, List[dict]]:
+        with span("retrieve", mode=self.mode):
+            return self._format(self.search(query, where))
 
-        context_chunks: List[str] = []
-        sources: List[dict] = []
+    async def aretrieve_context(self, query: str,
+                                where: Optional[Dict] = None) -> Tuple[str, List[dict]]:
+        with span("retrieve", mode=self.mode):
+            return self._format(await self.asearch(query, where))
 
-        for i, (content, metadata, score) in enumerate(results, 1):
-            context_chunks.append(
-                f"--- Snippet {i} (from {metadata['source']}) ---\n{content}"
-            )
-            sources.append({
-                "source": metadata["source"],
-                "chunk": metadata["chunk_index"],
-                "relevance_score": round(float(score), 4)
-            })
+    def retrieve_context_many(self, queries: List[str],
+                              where: Optional[Dict] = None) -> List[Tuple[str, List[dict]]]:
+        """``retrieve_context`` for many queries; vector search and reranking are batched."""
+        with span("retrieve_many", mode=self.mode, queries=len(queries)):
+            if self.mode == "vector":
+                where = where if where is not None else self.where
+                batches = self.vector_store.search_many(queries, k=self.fetch_k, where=where)
+                if self.reranker is not None:
+                    batches = self.reranker.rerank_many(queries, batches, self.k)
+            else:
+                batches = [self.search(query, where) for query in queries]
+            return [self._format(results) for results in batches]
 
-        formatted_context = "\n\n".join(context_chunks)
-        return formatted_context, sources
+    def _format(self, results: List[Tuple[str, dict, float]]) -> Tuple[str, List[dict]]:
+        with span("context_build"):
+            return self.context_builder.build(results)
 
     def build_prompt(self, context: str, question: str) -> str:
         system_prompt = (
@@ -0,0 +1,559 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import json
+import mmap
+import os
+import threading
+import uuid
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+
+
+class _Segment:
+    """One immutable, memory-mapped block of rows."""
+
+    def __init__(self, directory: str, name: str, start: int, rows: int):
+        self.directory = directory
+        self.name = name
+        self.start = start
+        self.rows = rows
+        self._vectors: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._records: Optional[mmap.mmap] = None
+        self._records_file = None
+        # Readers share segments; files are opened once, by the first of them.
+        self._open_lock = threading.Lock()
+
+    def path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}{suffix}")
+
+    @property
+    def vectors(self) -> np.ndarray:
+        vectors = self._vectors
+        if vectors is None:
+            with self._open_lock:
+                if self._vectors is None:
+                    self._vectors = np.load(self.path(".npy"), mmap_mode="r")
+                vectors = self._vectors
+        return vectors
+
+    def column_path(self, column: str) -> str:
+        return self.path(f".{column}.npy")
+
+    def _open_records(self) -> None:
+        with self._open_lock:
+            if self._records is not None:
+                return
+            offsets = np.load(self.path(".off.npy"), mmap_mode="r")
+            records_file = open(self.path(".rec"), "rb")
+            records = mmap.mmap(records_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._offsets, self._records_file = offsets, records_file
+            # Published last: a non-None _records means _offsets is set too.
+            self._records = records
+
+    def record(self, local_row: int) -> Dict:
+        if self._records is None:
+            self._open_records()
+        records, offsets = self._records, self._offsets
+        start = int(offsets[local_row])
+        end = int(offsets[local_row + 1])
+        return json.loads(records[start:end].decode("utf-8"))
+
+    def files(self) -> List[str]:
+        prefix = f"{self.name}."
+        return [
+            os.path.join(self.directory, f)
+            for f in os.listdir(self.directory)
+            if f.startswith(prefix)
+        ]
+
+    def close(self) -> None:
+        # Drop mmaps explicitly so files can be removed on Windows.
+        self._vectors = None
+        self._offsets = None
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+        if self._records_file is not None:
+            self._records_file.close()
+            self._records_file = None
+
+
+class SegmentStore:
+    """Append-only, memory-mapped storage for vectors, texts and metadata.
+
+    Each append writes a new segment and only touches the new rows; opening
+    the store reads the small manifest and maps segments lazily, so startup
+    cost does not depend on corpus size.
+
+    Files (inside ``directory``):
+      - manifest.json: format version, vector dimension and segment list
+      - seg-NNNNN.npy: float32 (rows, dim) embeddings, opened with mmap
+      - seg-NNNNN.rec: concatenated UTF-8 JSON records {"text", "meta"}
+      - seg-NNNNN.off.npy: int64 byte offsets into .rec (rows + 1 entries)
+      - seg-NNNNN.<column>.npy: optional per-row columns (e.g. chunk hashes)
+      - tombstones.bin: append-only int64 ids of deleted rows (a fresh
+        tombstones-NNNNN.bin after each compaction)
+
+    Deleted rows stay in their segment and are only masked out through
+    ``live_mask()``; the matrix is never copied to drop them. ``compact()``
+    later rewrites the segments that hold deleted rows and merges runs of
+    small appends, so the segment count (open files, per-query loops) stays
+    bounded.
+    """
+
+    MANIFEST = "manifest.json"
+    TOMBSTONES = "tombstones.bin"
+    # compact() merges adjacent segments up to this many rows; owners call it
+    # once there are more than MAX_SEGMENTS segments (see ``needs_merge``).
+    MERGE_ROWS = 16384
+    MAX_SEGMENTS = 64
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._manifest_path = os.path.join(self.directory, self.MANIFEST)
+        self._manifest = self._read_manifest()
+        self._segments = self._open_segments()
+        self._columns: Dict[str, np.ndarray] = {}
+        self._live: Optional[np.ndarray] = None
+        # Concurrent readers build the column and live-mask caches (and
+        # backfill column files) once, under this lock.
+        self._cache_lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+    def _read_manifest(self) -> Dict:
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported store format version: {manifest.get('version')}"
+                )
+            manifest.setdefault("store_id", uuid.uuid4().hex)
+            manifest.setdefault("sources", [])
+            manifest.setdefault("options", {})
+            return manifest
+        return self._empty_manifest(next_id=0, options={})
+
+    @staticmethod
+    def _empty_manifest(next_id: int, options: Dict) -> Dict:
+        return {
+            "version": FORMAT_VERSION,
+            "store_id": uuid.uuid4().hex,
+            "dim": None,
+            "next_id": next_id,
+            "options": options,
+            "sources": [],
+            "segments": [],
+        }
+
+    def _write_manifest(self) -> None:
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _open_segments(self) -> List[_Segment]:
+        segments = []
+        start = 0
+        for entry in self._manifest["segments"]:
+            segments.append(_Segment(self.directory, entry["name"], start, entry["rows"]))
+            start += entry["rows"]
+        return segments
+
+    @property
+    def _tombstones_path(self) -> str:
+        # Compaction switches to a fresh file through the manifest, so old
+        # row ids are never applied to renumbered rows.
+        return os.path.join(self.directory, self._manifest.get("tombstones", self.TOMBSTONES))
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every compaction (row ids change); persisted in the manifest."""
+        return self._manifest.get("generation", 0)
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self._manifest_path)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._manifest["dim"]
+
+    @property
+    def store_id(self) -> str:
+        """Random id that changes whenever the store is cleared."""
+        return self._manifest["store_id"]
+
+    def __len__(self) -> int:
+        return sum(seg.rows for seg in self._segments)
+
+    def option(self, key: str, default=None):
+        """Store-wide setting persisted in the manifest (survives clear())."""
+        return self._manifest["options"].get(key, default)
+
+    def set_option(self, key: str, value) -> None:
+        self._manifest["options"][key] = value
+        self._write_manifest()
+
+    def source_code(self, name: str, create: bool = False) -> Optional[int]:
+        """Integer code for a source name, optionally registering it."""
+        return self.label_code("sources", name, create)
+
+    def label_code(self, registry: str, name: str, create: bool = False) -> Optional[int]:
+        """Integer code for ``name`` in a manifest string registry (e.g. "file_types")."""
+        labels = self._manifest.setdefault(registry, [])
+        try:
+            return labels.index(name)
+        except ValueError:
+            if not create:
+                return None
+            labels.append(name)
+            return len(labels) - 1
+
+    def labels(self, registry: str) -> List[str]:
+        """Names of a registry, indexed by code."""
+        return list(self._manifest.get(registry, []))
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def append(self, vectors: np.ndarray, texts: List[str], metas: List[Dict],
+               columns: Optional[Dict[str, np.ndarray]] = None) -> range:
+        """Write a new segment and return the global row ids it occupies."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or not (len(vectors) == len(texts) == len(metas)):
+            raise ValueError("vectors, texts and metas must have matching lengths")
+        if len(vectors) == 0:
+            return range(len(self), len(self))
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}"
+            )
+
+        name = f"seg-{self._manifest['next_id']:05d}"
+        start = len(self)
+        segment = _Segment(self.directory, name, start, len(vectors))
+
+        np.save(segment.path(".npy"), vectors)
+
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        with open(segment.path(".rec"), "wb") as f:
+            pos = 0
+            for i, (text, meta) in enumerate(zip(texts, metas)):
+                blob = json.dumps(
+                    {"text": text, "meta": meta}, ensure_ascii=False
+                ).encode("utf-8")
+                f.write(blob)
+                pos += len(blob)
+                offsets[i + 1] = pos
+        np.save(segment.path(".off.npy"), offsets)
+        for column, values in (columns or {}).items():
+            values = np.asarray(values)
+            if len(values) != len(vectors):
+                raise ValueError(f"Column {column!r} has {len(values)} rows, expected {len(vectors)}")
+            np.save(segment.column_path(column), values)
+
+        # The manifest is written last, so a crash mid-append leaves only
+        # unreferenced files behind.
+        self._manifest["dim"] = int(vectors.shape[1])
+        self._manifest["next_id"] += 1
+        self._manifest["segments"].append({"name": name, "rows": len(vectors)})
+        self._write_manifest()
+        self._segments.append(segment)
+        for column in list(self._columns):
+            if os.path.exists(segment.column_path(column)):
+                self._columns[column] = np.concatenate(
+                    [self._columns[column], np.load(segment.column_path(column))]
+                )
+            else:
+                del self._columns[column]
+        if self._live is not None:
+            self._live = np.concatenate([self._live, np.ones(len(vectors), dtype=bool)])
+        return range(start, start + len(vectors))
+
+    def delete(self, rows) -> int:
+        """Tombstone rows; returns how many were live before the call."""
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if len(rows) == 0:
+            return 0
+        live = self.live_mask()
+        rows = rows[live[rows]]
+        if len(rows) == 0:
+            return 0
+        with open(self._tombstones_path, "ab") as f:
+            f.write(rows.astype("<i8").tobytes())
+        live[rows] = False
+        return len(rows)
+
+    def clear(self) -> None:
+        for seg in self._segments:
+            seg.close()
+            for path in seg.files():
+                os.remove(path)
+        if os.path.exists(self._tombstones_path):
+            os.remove(self._tombstones_path)
+        self._segments = []
+        self._columns.clear()
+        self._live = None
+        self._manifest = self._empty_manifest(
+            next_id=self._manifest["next_id"], options=self._manifest["options"]
+        )
+        self._write_manifest()
+
+    def close(self) -> None:
+        for seg in self._segments:
+            seg.close()
+
+    def _merge_groups(self, live: np.ndarray) -> List[List[_Segment]]:
+        """Split the segments into runs of adjacent ones that fit in ``MERGE_ROWS`` live rows.
+
+        A segment that is already that large forms a run of its own.
+        """
+        groups: List[List[_Segment]] = []
+        rows = 0
+        for seg in self._segments:
+            kept = int(live[seg.start:seg.start + seg.rows].sum())
+            if groups and rows + kept <= self.MERGE_ROWS:
+                groups[-1].append(seg)
+                rows += kept
+            else:
+                groups.append([seg])
+                rows = kept
+        return groups
+
+    @property
+    def needs_merge(self) -> bool:
+        """True when there are more than ``MAX_SEGMENTS`` segments and some can be merged."""
+        if len(self._segments) <= self.MAX_SEGMENTS:
+            return False
+        return any(len(group) > 1 for group in self._merge_groups(self.live_mask()))
+
+    def _merge_segments(self, parts: List[Tuple[_Segment, np.ndarray]]) -> _Segment:
+        """Copy the kept rows of adjacent segments (and their ``.npy`` columns) into a new one."""
+        new = _Segment(self.directory, f"seg-{self._manifest['next_id']:05d}", 0,
+                       int(sum(keep.sum() for _, keep in parts)))
+        self._manifest["next_id"] += 1
+        np.save(new.path(".npy"), np.concatenate([seg.vectors[keep] for seg, keep in parts]))
+
+        lengths = []
+        with open(new.path(".rec"), "wb") as out:
+            for seg, keep in parts:
+                offsets = np.load(seg.path(".off.npy"))
+                starts, ends = offsets[:-1][keep], offsets[1:][keep]
+                with open(seg.path(".rec"), "rb") as f:
+                    blob = f.read()
+                for start, end in zip(starts, ends):
+                    out.write(blob[start:end])
+                lengths.append(ends - starts)
+        lengths = np.concatenate(lengths)
+        np.save(new.path(".off.npy"), np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+
+        # Columns missing from any part are backfilled on first use instead.
+        columns = None
+        for seg, _ in parts:
+            prefix = seg.path(".")
+            names = {
+                path[len(prefix):] for path in seg.files()
+                if path.endswith(".npy") and path[len(prefix):] not in ("npy", "off.npy")
+            }
+            columns = names if columns is None else columns & names
+        for column in sorted(columns or ()):
+            np.save(new.path("." + column), np.concatenate(
+                [np.load(seg.path("." + column))[keep] for seg, keep in parts]
+            ))
+        return new
+
+    def compact(self, on_segment: Optional[Callable[[List[Tuple[str, np.ndarray]], str], None]] = None
+                ) -> Optional[np.ndarray]:
+        """Drop tombstoned rows and merge runs of small adjacent segments.
+
+        Segments without deletions that have no small neighbour are kept as
+        they are; the others are rewritten, adjacent ones into a single
+        segment of up to ``MERGE_ROWS`` rows. Row ids after a dropped row
+        shift down; merging alone leaves them unchanged.
+        ``on_segment(parts, new_prefix)`` lets owners of sidecar files
+        rewrite theirs, where ``parts`` lists ``(old_prefix, keep)`` in row
+        order (``keep`` is the segment-local boolean mask). Returns the
+        boolean mask of old rows that were kept, or None when nothing changed.
+        """
+        live = self.live_mask()
+        groups = self._merge_groups(live)
+        if live.all() and all(len(group) == 1 for group in groups):
+            return None
+        entries, rewritten = [], []
+        for group in groups:
+            parts = [(seg, live[seg.start:seg.start + seg.rows]) for seg in group]
+            if len(group) == 1 and parts[0][1].all():
+                entries.append({"name": group[0].name, "rows": group[0].rows})
+                continue
+            rewritten.extend(group)
+            parts = [(seg, keep) for seg, keep in parts if keep.any()]
+            if not parts:
+                continue
+            new = self._merge_segments(parts)
+            if on_segment is not None:
+                on_segment([(seg.path(""), keep) for seg, keep in parts], new.path(""))
+            entries.append({"name": new.name, "rows": new.rows})
+
+        # Switch segments and tombstones in one manifest write; a crash
+        # before it leaves only unreferenced files behind.
+        old_tombstones = self._tombstones_path
+        self._manifest["segments"] = entries
+        self._manifest["tombstones"] = f"tombstones-{self._manifest['next_id']:05d}.bin"
+        self._manifest["next_id"] += 1
+        self._manifest["generation"] = self.generation + 1
+        self._write_manifest()
+
+        for seg in rewritten:
+            seg.close()
+            for path in seg.files():
+                os.remove(path)
+        if os.path.exists(old_tombstones):
+            os.remove(old_tombstones)
+        self._segments = self._open_segments()
+        self._columns = {name: values[live] for name, values in self._columns.items()}
+        self._live = None
+        return live.copy()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def segments(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield ``(start_row, vectors)`` for every segment, in row order."""
+        for seg in self._segments:
+            yield seg.start, seg.vectors
+
+    def live_mask(self) -> np.ndarray:
+        """Boolean array over all rows, False where a row is tombstoned."""
+        live = self._live
+        if live is None:
+            with self._cache_lock:
+                if self._live is None:
+                    live = np.ones(len(self), dtype=bool)
+                    if os.path.exists(self._tombstones_path):
+                        deleted = np.fromfile(self._tombstones_path, dtype="<i8")
+                        live[deleted[deleted < len(live)]] = False
+                    self._live = live
+                live = self._live
+        return live
+
+    @property
+    def live_count(self) -> int:
+        return int(self.live_mask().sum())
+
+    def column(self, name: str, dtype,
+               backfill: Optional[Callable[[str, Dict], object]] = None,
+               from_vectors: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> np.ndarray:
+        """Concatenate a per-row column across all segments.
+
+        Segments written before the column existed are filled once, either
+        row by row with ``backfill(text, meta)`` or for the whole segment with
+        ``from_vectors(vectors)``, and the result is saved next to them.
+        """
+        values = self._columns.get(name)
+        if values is not None:
+            return values
+        with self._cache_lock:
+            if name not in self._columns:
+                self._columns[name] = self._load_column(name, dtype, backfill, from_vectors)
+            return self._columns[name]
+
+    def _load_column(self, name: str, dtype, backfill, from_vectors) -> np.ndarray:
+        parts = []
+        for seg in self._segments:
+            path = seg.column_path(name)
+            if not os.path.exists(path):
+                if from_vectors is not None:
+                    values = np.asarray(from_vectors(seg.vectors), dtype=dtype)
+                elif backfill is not None:
+                    values = np.array(
+                        [backfill(*self.record(seg.start + i)) for i in range(seg.rows)],
+                        dtype=dtype,
+                    )
+                else:
+                    raise KeyError(f"Segment {seg.name} has no column {name!r}")
+                np.save(path, values)
+                self._write_manifest()  # persist any source codes created by backfill
+            parts.append(np.load(path))
+        values = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+        return values.astype(dtype, copy=False)
+
+    def segment_ranges(self) -> Iterator[Tuple[range, str]]:
+        """Yield each segment's global row range and a path prefix for sidecar files.
+
+        Files named ``<prefix>.<suffix>`` belong to the segment and are
+        removed with it.
+        """
+        for seg in self._segments:
+            yield range(seg.start, seg.start + seg.rows), seg.path("")
+
+    def _locate(self, row: int) -> Tuple[_Segment, int]:
+        if row < 0 or row >= len(self):
+            raise IndexError(f"Row {row} out of range")
+        lo, hi = 0, len(self._segments) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._segments[mid].start <= row:
+                lo = mid
+            else:
+                hi = mid - 1
+        seg = self._segments[lo]
+        return seg, row - seg.start
+
+    def record(self, row: int) -> Tuple[str, Dict]:
+        """Return ``(text, metadata)`` for a global row id."""
+        seg, local = self._locate(row)
+        rec = seg.record(local)
+        return rec["text"], rec["meta"]
+
+    def vectors_for(self, rows) -> np.ndarray:
+        """Gather the embedding rows for the given global row ids."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim or 0), dtype=np.float32)
+        if len(rows) == 0:
+            return out
+        starts = np.array([seg.start for seg in self._segments], dtype=np.int64)
+        owner = np.searchsorted(starts, rows, side="right") - 1
+        for seg_idx in np.unique(owner):
+            seg = self._segments[int(seg_idx)]
+            pick = np.flatnonzero(owner == seg_idx)
+            out[pick] = seg.vectors[rows[pick] - seg.start]
+        return out
+
+    # ------------------------------------------------------------------
+    # Migration
+    # ------------------------------------------------------------------
+    def migrate_legacy(self, emb_path: str, meta_path: str, texts_path: str,
+                       transform=None) -> int:
+        """One-shot import of the old index.npz + meta.json + texts.json layout.
+
+        The legacy files are renamed with a ``.migrated`` suffix afterwards so
+        the import never runs twice. Returns the number of imported rows.
+        """
+        emb = np.load(emb_path)["arr_0"]
+        metas: List[Dict] = []
+        texts: List[str] = []
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                metas = json.load(f)
+        if os.path.exists(texts_path):
+            with open(texts_path, "r", encoding="utf-8") as f:
+                texts = json.load(f)
+
+        rows = min(len(emb), len(metas), len(texts))
+        if rows:
+            vectors = emb[:rows] if transform is None else transform(emb[:rows])
+            self.append(vectors, texts[:rows], metas[:rows])
+        elif not self.exists:
+            self._write_manifest()
+
+        for path in (emb_path, meta_path, texts_path):
+            if os.path.exists(path):
+                os.replace(path, path + ".migrated")
+        return rows
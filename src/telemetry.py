@@ -0,0 +1,219 @@
+from typing import Callable, Dict, Iterator, List, Optional
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+
+import numpy as np
+
+
+class Histogram:
+    """Latencies of one stage: running totals plus a window of recent samples.
+
+    Percentiles are computed over the last ``window`` observations, so they
+    follow the current behaviour rather than the whole process lifetime.
+    """
+
+    def __init__(self, window: int = 4096):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: deque = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._recent.append(value)
+
+    def percentiles(self, qs=(50, 95, 99)) -> Dict[str, float]:
+        if not self._recent:
+            return {f"p{q}": 0.0 for q in qs}
+        values = np.percentile(np.fromiter(self._recent, dtype=np.float64), qs)
+        return {f"p{q}": float(v) for q, v in zip(qs, values)}
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            **self.percentiles(),
+            "max": self.max,
+        }
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class Telemetry:
+    """Process-wide spans, latency histograms and counters.
+
+    ``span(name)`` times a block into the ``name`` histogram (seconds);
+    ``incr(name)`` bumps a counter. With ``jsonl_path`` every span is also
+    appended to that file as one JSON line. ``prometheus()`` renders the
+    metrics in the Prometheus text format and ``serve_prometheus(port)``
+    exposes them at ``/metrics``.
+    """
+
+    def __init__(self, window: int = 4096, jsonl_path: Optional[str] = None,
+                 prefix: str = "rag"):
+        self.window = window
+        self.jsonl_path = jsonl_path
+        self.prefix = prefix
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._jsonl = None
+
+    # -- recording -----------------------------------------------------
+    def observe(self, name: str, seconds: float, **attrs) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.window)
+            histogram.observe(seconds)
+            if self.jsonl_path:
+                self._write({"ts": time.time(), "span": name, "seconds": seconds, **attrs})
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Dict]:
+        """Time the block; attributes added to the yielded dict go to the JSONL record."""
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.observe(name, time.perf_counter() - start, **attrs)
+
+    def timed(self, name: str) -> Callable:
+        """Decorator form of ``span``."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _write(self, record: Dict) -> None:
+        # Called with the lock held.
+        if self._jsonl is None:
+            self._jsonl = open(self.jsonl_path, "a", encoding="utf-8", buffering=1)
+        self._jsonl.write(json.dumps(record, default=str) + "\n")
+
+    # -- export --------------------------------------------------------
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                "spans": {name: h.summary() for name, h in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        seconds = f"{self.prefix}_stage_seconds"
+        lines = [f"# TYPE {seconds} summary"]
+        for name, s in snapshot["spans"].items():
+            for q in (50, 95, 99):
+                lines.append(f'{seconds}{{stage="{name}",quantile="{q / 100:g}"}} {s[f"p{q}"]:.6f}')
+            lines.append(f'{seconds}_sum{{stage="{name}"}} {s["sum"]:.6f}')
+            lines.append(f'{seconds}_count{{stage="{name}"}} {s["count"]}')
+        for name, value in snapshot["counters"].items():
+            metric = f"{self.prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def export_jsonl(self, path: str) -> None:
+        """Append the current snapshot to ``path`` as one JSON line."""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"ts": time.time(), **self.snapshot()}) + "\n")
+
+    def serve_prometheus(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Serve ``/metrics`` from a daemon thread."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # -- profiling -----------------------------------------------------
+    @contextlib.contextmanager
+    def profile(self, enabled: bool = True, directory: Optional[str] = None,
+                limit: int = 25) -> Iterator[Dict]:
+        """cProfile the block (calling thread only).
+
+        The yielded dict gets ``report`` (top ``limit`` functions by
+        cumulative time) on exit, and ``path`` when ``directory`` is given
+        (a ``.prof`` file for snakeviz or ``pstats``).
+        """
+        result: Dict = {}
+        if not enabled:
+            yield result
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+            result["report"] = out.getvalue()
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+                result["path"] = os.path.join(directory, f"request-{time.time_ns()}.prof")
+                profiler.dump_stats(result["path"])
+
+
+TELEMETRY = Telemetry(jsonl_path=os.getenv("TELEMETRY_JSONL"))
+
+
+def span(name: str, **attrs):
+    return TELEMETRY.span(name, **attrs)
+
+
+def incr(name: str, value: float = 1) -> None:
+    TELEMETRY.incr(name, value)
+
+
+def stage_table(snapshot: Dict[str, Dict]) -> List[Dict]:
+    """Rows of ``snapshot["spans"]`` in milliseconds, for display."""
+    return [
+        {"stage": name, "count": s["count"],
+         **{k: round(s[k] * 1000, 2) for k in ("mean", "p50", "p95", "p99", "max")}}
+        for name, s in snapshot["spans"].items()
+    ]
@@ -1,10 +1,28 @@
-from typing import List, Dict, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import hashlib
 import os
-from dotenv import load_dotenv
+import threading
+import time
 import numpy as np
-import json
 
-load_dotenv()
+from src.ann_index import INDEX_TYPES, VectorIndex, make_index, normalize as _normalize
+from src.concurrency import ReadWriteLock
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache, embedding_model_name
+from src.embedding_pipeline import EmbeddingBatcher
+from src.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from src.quantization import QUANTIZATIONS, CompactMatrix, quantized_columns
+from src.segment_store import SegmentStore
+from src.telemetry import incr, span
+
+
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Support Streamlit Cloud secrets
 def get_api_key():
@@ -15,131 +33,870 @@ def get_api_key():
             return st.secrets['GOOGLE_API_KEY']
     except:
         pass
+    _load_env()
     return os.getenv("GOOGLE_API_KEY")
 
+# Optional chunk metadata from the loader: PDF page span and section heading.
+LOCATION_KEYS = ("page", "page_end", "heading")
+
+# Query vectors kept for query_vector_if_known.
+_RECENT_QUERIES = 1024
+
+
+def chunk_hash(text: str) -> int:
+    """64-bit content hash used to deduplicate chunks."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def file_type(source: str) -> str:
+    """Lower-case extension without the dot ("pdf", "md", ...)."""
+    return Path(source).suffix.lower().lstrip(".") or "unknown"
+
+
+def embedding_dimension(embeddings) -> int:
+    """Vector size of an embeddings object (one probe call if it does not say)."""
+    dim = getattr(embeddings, "dim", None)
+    if dim is None:
+        dim = len(embeddings.embed_query("dimension check"))
+    return int(dim)
+
+
+def _first_of_pairs(sources: List[str], hashes: np.ndarray) -> np.ndarray:
+    """Index of the first occurrence of each distinct (source, hash) pair."""
+    seen = {}
+    for i, pair in enumerate(zip(sources, hashes.tolist())):
+        seen.setdefault(pair, i)
+    return np.array(sorted(seen.values()), dtype=np.int64)
+
+
+def _chunk_number(value) -> int:
+    # Older stores kept chunk_index as a string.
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+_RANGE_OPS = {
+    "$eq": np.equal, "$ne": np.not_equal,
+    "$gt": np.greater, "$gte": np.greater_equal,
+    "$lt": np.less, "$lte": np.less_equal,
+}
+
+
+def _match(values: np.ndarray, condition) -> np.ndarray:
+    """Boolean mask of ``values`` satisfying a scalar, list or {"$op": x} condition."""
+    if isinstance(condition, dict):
+        mask = np.ones(len(values), dtype=bool)
+        for op, operand in condition.items():
+            if op == "$in":
+                mask &= np.isin(values, list(operand))
+            elif op in _RANGE_OPS:
+                mask &= _RANGE_OPS[op](values, operand)
+            else:
+                raise ValueError(f"Unsupported filter operator {op!r}")
+        return mask
+    if isinstance(condition, (list, tuple, set)):
+        return np.isin(values, list(condition))
+    return values == condition
+
+
+@lru_cache(maxsize=1)
+def default_embeddings():
+    """Process-wide embedding client shared by every store instance."""
+    # Try Gemini embeddings, fallback to HF if quota fails or no key
+    try:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        api_key = get_api_key()
+        if not api_key:
+            raise RuntimeError("Missing GOOGLE_API_KEY")
+
+        return GoogleGenerativeAIEmbeddings(
+            model="models/text-embedding-004",
+            google_api_key=api_key
+        )
+    except Exception:
+        pass
+
+    # Offline ONNX backend: no torch import, no network once the model is cached
+    try:
+        from src.local_embeddings import LocalEmbeddings
+        embeddings = LocalEmbeddings()
+        print("⚠️ Using local ONNX embeddings (Gemini unavailable)")
+        return embeddings
+    except Exception:
+        from langchain.embeddings import HuggingFaceEmbeddings
+        print("⚠️ Using HuggingFace embeddings (Gemini unavailable)")
+        return HuggingFaceEmbeddings(
+            model_name="sentence-transformers/all-MiniLM-L6-v2"
+        )
+
+
 class VectorStoreManager:
     """Minimal numpy vector store (no C++ build tools required).
 
-    Files:
-      - index.npz: embeddings
-      - meta.json: list of metadatas
-      - texts.json: list of original texts
+    Embeddings are stored L2-normalized, so a query is a single
+    matrix-vector product followed by a partial top-k selection.
+
+    Rows live in an append-only, memory-mapped SegmentStore inside
+    ``persist_directory`` (see src/segment_store.py). Stores written in the
+    old index.npz + meta.json + texts.json layout are migrated on open.
+
+    Every row carries a content hash; a chunk whose text is already stored
+    is never embedded or stored again. Deleted rows are tombstoned and
+    masked out of scoring; ``upsert_source`` replaces one document while
+    embedding only its changed chunks. Once more than ``compact_threshold``
+    of the rows are tombstoned, or once many small appends have piled up
+    segments, a background thread rewrites the affected segments
+    (``compact``).
+
+    Search goes through a pluggable index (src/ann_index.py): ``"exact"``
+    brute force by default, or ``"ivf"`` for approximate search on large
+    corpora, tuned through ``index_params`` (e.g. ``{"nprobe": 16}``).
+
+    ``vector_dtype="float16"`` or ``"int8"`` keeps a compact copy of the
+    matrix for the first scoring pass and rescores the best
+    ``k * rescore_factor`` candidates exactly. The choice is persisted in
+    the store manifest and reused when the store is reopened.
+
+    A BM25 index (src/lexical_index.py) is kept alongside the texts;
+    ``lexical_search`` and ``hybrid_search`` (reciprocal rank fusion of
+    BM25 and cosine rankings) find exact identifiers and error codes that
+    embeddings tend to miss.
+
+    Source, file type, chunk index and ingest time are kept as per-row
+    columns, with row lists per source and per file type, so
+    ``search(query, k, where={"source": "a.pdf"})`` only scores the
+    matching rows. See ``_filter_rows`` for the accepted filters.
+
+    One instance is safe to share between threads: searches hold a shared
+    read lock and run concurrently, while writes take the lock exclusively.
+    Embedding calls happen outside the lock.
     """
 
     def __init__(self, collection_name: str = "codewhisperer",
-                 persist_directory: str = "./chroma_data"):
+                 persist_directory: str = "./chroma_data",
+                 embeddings=None,
+                 cache_embeddings: bool = True,
+                 embedding_workers: int = 4,
+                 embedding_requests_per_minute: float = 1500,
+                 index: str = "exact",
+                 index_params: Optional[Dict] = None,
+                 vector_dtype: Optional[str] = None,
+                 rescore_factor: int = 4,
+                 compact_threshold: Optional[float] = 0.25):
         self.collection_name = collection_name
         self.persist_directory = persist_directory
         os.makedirs(self.persist_directory, exist_ok=True)
 
-        # Try Gemini embeddings, fallback to HF if quota fails or no key
-        try:
-            from langchain_google_genai import GoogleGenerativeAIEmbeddings
-            api_key = get_api_key()
-            if not api_key:
-                raise RuntimeError("Missing GOOGLE_API_KEY")
-
-            self.embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/text-embedding-004",
-                google_api_key=api_key
+        self._lock = ReadWriteLock()
+        self._store = SegmentStore(self.persist_directory)
+        self._migrate_legacy()
+
+        # The default (Gemini) client is created on first embedding call, so
+        # opening the store never imports the provider SDK.
+        self._embeddings = None
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self.embedding_model: Optional[str] = None
+        self._embedding_settings = (cache_embeddings, embedding_workers,
+                                    embedding_requests_per_minute)
+        self._embeddings_lock = threading.Lock()
+        # Recently embedded queries, so callers can reuse a vector without
+        # risking a new embedding call (see query_vector_if_known).
+        self._query_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_vectors_lock = threading.Lock()
+        if embeddings is not None:
+            self._init_embeddings(embeddings)
+
+        if index not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index!r}; expected one of {sorted(INDEX_TYPES)}")
+        self._index: Optional[VectorIndex] = None
+        self._index_spec = (index, dict(index_params or {}), rescore_factor)
+        self._index_lock = threading.Lock()
+        self.lexical = LexicalIndex(self._store)
+        # Categorical column -> {code: sorted row ids}, built on first use.
+        self._inverted: Dict[str, Dict[int, np.ndarray]] = {}
+        # Tombstoned share of rows that triggers compaction (None = never).
+        self.compact_threshold = compact_threshold
+        self._compaction_lock = threading.Lock()
+
+        stored_dtype = self._store.option("vector_dtype", "float32")
+        self.vector_dtype = vector_dtype or stored_dtype
+        if self.vector_dtype not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unsupported vector_dtype {self.vector_dtype!r}; expected one of {QUANTIZATIONS}"
+            )
+        if self.vector_dtype != stored_dtype:
+            self._store.set_option("vector_dtype", self.vector_dtype)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    self._init_embeddings(default_embeddings())
+        return self._embeddings
+
+    def _init_embeddings(self, embeddings) -> None:
+        cache_embeddings, workers, requests_per_minute = self._embedding_settings
+        model_name = embedding_model_name(embeddings)
+        self.embedding_model = model_name
+        self._check_embedding_model(embeddings)
+        if not getattr(embeddings, "local", False):
+            # Concurrent, rate-limited, retrying batches sized for the provider.
+            embeddings = EmbeddingBatcher(
+                embeddings,
+                max_workers=workers,
+                requests_per_minute=requests_per_minute,
             )
-        except Exception:
-            from langchain.embeddings import HuggingFaceEmbeddings
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2"
+        if cache_embeddings:
+            # Survives clear_store(), so re-uploads and repeated questions
+            # never hit the embedding API twice.
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(self.persist_directory, "embedding_cache.sqlite"),
+                model_name,
             )
-            print("⚠️ Using HuggingFace embeddings (Gemini unavailable)")
+            embeddings = CachedEmbeddings(embeddings, self.embedding_cache)
+        self._embeddings = embeddings
 
-        self._emb_path = os.path.join(self.persist_directory, "index.npz")
-        self._meta_path = os.path.join(self.persist_directory, "meta.json")
-        self._texts_path = os.path.join(self.persist_directory, "texts.json")
+    @property
+    def index(self) -> VectorIndex:
+        """Search index, opened on first use (IVF loads its lists from disk)."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    kind, params, rescore_factor = self._index_spec
+                    index = make_index(kind, self._store, **params)
+                    if self.vector_dtype != "float32":
+                        index.compact = CompactMatrix(self._store, self.vector_dtype)
+                        index.rescore_factor = rescore_factor
+                    self._index = index
+        return self._index
 
-        self._emb = self._load_embeddings()
-        self._meta = self._load_json(self._meta_path, default=[])
-        self._texts = self._load_json(self._texts_path, default=[])
+    def _check_embedding_model(self, embeddings) -> None:
+        """Refuse to mix vectors from different embedding models in one store.
 
-    def _load_embeddings(self) -> np.ndarray:
-        if os.path.exists(self._emb_path):
-            data = np.load(self._emb_path)
-            return data["arr_0"]
-        return np.empty((0, 768), dtype=np.float32)
+        The model name is kept in the manifest options and the vector
+        dimension in the manifest itself (enforced on every append). Stores
+        written before the name was recorded are only pinned to a model
+        whose vectors have their dimension.
+        """
+        stored = self._store.option("embedding_model")
+        if stored == self.embedding_model:
+            return
+        if stored is not None and len(self._store) > 0:
+            raise ValueError(
+                f"Store at {self.persist_directory} holds {self._store.dim}-dim vectors from "
+                f"{stored!r}, but the configured embedding model is {self.embedding_model!r}. "
+                "Use the same model or clear the store first."
+            )
+        if stored is None and len(self._store) > 0:
+            dim = embedding_dimension(embeddings)
+            if dim != self._store.dim:
+                raise ValueError(
+                    f"Store at {self.persist_directory} holds {self._store.dim}-dim vectors, "
+                    f"but the configured embedding model {self.embedding_model!r} produces "
+                    f"{dim}-dim vectors. Use the same model or clear the store first."
+                )
+        self._store.set_option("embedding_model", self.embedding_model)
 
-    @staticmethod
-    def _load_json(path: str, default):
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return default
+    def _migrate_legacy(self) -> None:
+        emb_path = os.path.join(self.persist_directory, "index.npz")
+        if not os.path.exists(emb_path) or len(self._store) > 0:
+            return
+        rows = self._store.migrate_legacy(
+            emb_path,
+            os.path.join(self.persist_directory, "meta.json"),
+            os.path.join(self.persist_directory, "texts.json"),
+            # Older stores hold raw vectors; normalizing is idempotent.
+            transform=_normalize,
+        )
+        print(f"ℹ️ Migrated {rows} chunks to the segment store format")
 
-    @staticmethod
-    def _write_json(path: str, data) -> None:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def __len__(self) -> int:
+        return self._store.live_count
+
+    @property
+    def store_id(self) -> str:
+        return self._store.store_id
+
+    def _hashes(self) -> np.ndarray:
+        return self._store.column(
+            "hash", np.uint64, backfill=lambda text, meta: chunk_hash(text)
+        )
+
+    def _source_codes(self) -> np.ndarray:
+        return self._store.column(
+            "source", np.int32,
+            backfill=lambda text, meta: self._store.source_code(
+                meta.get("source", "unknown"), create=True
+            ),
+        )
+
+    def _file_type_codes(self) -> np.ndarray:
+        return self._store.column(
+            "ftype", np.int16,
+            backfill=lambda text, meta: self._store.label_code(
+                "file_types", file_type(meta.get("source", "unknown")), create=True
+            ),
+        )
+
+    def _chunk_numbers(self) -> np.ndarray:
+        return self._store.column(
+            "chunk", np.int32, backfill=lambda text, meta: _chunk_number(meta.get("chunk_index"))
+        )
+
+    def _ingest_times(self) -> np.ndarray:
+        # 0.0 = ingested before the column existed.
+        return self._store.column("ingested", np.float64, backfill=lambda text, meta: 0.0)
+
+    def _categorical(self, column: str) -> np.ndarray:
+        return self._source_codes() if column == "source" else self._file_type_codes()
+
+    def _postings(self, column: str) -> Dict[int, np.ndarray]:
+        """Row ids per code of a categorical column, dead rows included."""
+        postings = self._inverted.get(column)
+        if postings is None:
+            codes = self._categorical(column)
+            order = np.argsort(codes, kind="stable").astype(np.int64)
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            postings = {int(codes[group[0]]): group for group in np.split(order, bounds)
+                        if len(group)}
+            self._inverted[column] = postings
+        return postings
 
-    def _save(self) -> None:
-        np.savez_compressed(self._emb_path, self._emb)
-        self._write_json(self._meta_path, self._meta)
-        self._write_json(self._texts_path, self._texts)
+    def _extend_postings(self, rows: range, columns: Dict[str, np.ndarray]) -> None:
+        for column, key in (("source", "source"), ("file_type", "ftype")):
+            postings = self._inverted.get(column)
+            if postings is None:
+                continue
+            codes = columns[key]
+            for code in np.unique(codes):
+                new = rows.start + np.flatnonzero(codes == code)
+                old = postings.get(int(code), np.empty(0, dtype=np.int64))
+                postings[int(code)] = np.concatenate([old, new])
+
+    def _filter_rows(self, where: Dict) -> np.ndarray:
+        """Sorted live row ids matching ``where``.
+
+        Supported keys: ``source`` and ``file_type`` (a value or a list of
+        values, resolved through the per-code row lists) and ``chunk_index``
+        and ``ingested_at`` (a value, a list, or operators such as
+        ``{"$gte": 10, "$lt": 20}``). Numeric conditions are only evaluated on
+        rows left by the categorical ones.
+        """
+        unknown = set(where) - {"source", "file_type", "chunk_index", "ingested_at"}
+        if unknown:
+            raise ValueError(f"Unsupported filter field(s): {sorted(unknown)}")
+        rows: Optional[np.ndarray] = None
+        for field, registry in (("source", "sources"), ("file_type", "file_types")):
+            if field not in where:
+                continue
+            values = where[field]
+            values = [values] if isinstance(values, str) else list(values)
+            if field == "file_type":
+                values = [v.lower().lstrip(".") for v in values]
+            postings = self._postings(field)
+            codes = [self._store.label_code(registry, v) for v in values]
+            parts = [postings[c] for c in codes if c is not None and c in postings]
+            matched = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        for field, column in (("chunk_index", self._chunk_numbers),
+                              ("ingested_at", self._ingest_times)):
+            if field not in where:
+                continue
+            values = column()
+            if rows is None:
+                rows = np.flatnonzero(_match(values, where[field]))
+            else:
+                rows = rows[_match(values[rows], where[field])]
+        if rows is None:
+            rows = np.arange(len(self._store), dtype=np.int64)
+        return rows[self._store.live_mask()[rows]]
+
+    def _source_rows(self, source: str) -> np.ndarray:
+        return self._filter_rows({"source": source})
+
+    def sources(self) -> List[str]:
+        """Names of sources with at least one live chunk."""
+        with self._lock.read():
+            live = self._store.live_mask()
+            codes = np.unique(self._source_codes()[live])
+            names = self._store.labels("sources")
+            return [names[int(c)] for c in codes]
 
     def _clean_docs(self, documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
         cleaned = []
         for d in documents:
             content = (d.get("content") or "").strip()
             if content:
-                cleaned.append({
+                doc = {
                     "content": content,
                     "source": d.get("source", "unknown"),
-                    "chunk_index": d.get("chunk_index", 0),
-                })
+                    "chunk_index": _chunk_number(d.get("chunk_index", 0)),
+                }
+                doc.update({k: d[k] for k in LOCATION_KEYS if d.get(k) is not None})
+                cleaned.append(doc)
         return cleaned
 
-    def add_documents(self, documents: List[Dict[str, str]]) -> None:
+    def add_documents(self, documents: List[Dict[str, str]],
+                      vectors: Optional[np.ndarray] = None) -> int:
+        """Embed and store chunks, skipping any whose text its source already has.
+
+        Text stored under another source gets a row of its own, with the
+        stored vector reused instead of embedded again. ``vectors`` may carry
+        precomputed embeddings (one row per document) to skip the embedding
+        call. Returns the number of rows added.
+        """
+        if vectors is not None:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            non_empty = [bool((d.get("content") or "").strip()) for d in documents]
+            vectors = vectors[np.array(non_empty, dtype=bool)]
         docs = self._clean_docs(documents)
         if not docs:
-            return
+            return 0
 
-        texts = [d["content"] for d in docs]
-        metadatas = [
-            {"source": d["source"], "chunk_index": str(d["chunk_index"])}
-            for d in docs
-        ]
+        hashes = np.array([chunk_hash(d["content"]) for d in docs], dtype=np.uint64)
+        sources = [d["source"] for d in docs]
+        keep = np.zeros(len(docs), dtype=bool)
+        keep[_first_of_pairs(sources, hashes)] = True
+        reuse = None
+        with self._lock.read():
+            keep &= ~self._contains_in_sources(hashes, sources)
+            if not keep.any():
+                return 0
+            docs = [d for d, k in zip(docs, keep) if k]
+            hashes = hashes[keep]
+            if vectors is not None:
+                vectors = vectors[keep]
+            else:
+                shared = self._live_rows_for(hashes)
+                reuse = np.array([int(h) in shared for h in hashes], dtype=bool)
+                vectors = np.empty((len(docs), self._store.dim or 0), dtype=np.float32)
+                vectors[reuse] = self._store.vectors_for(
+                    [shared[int(h)] for h in hashes[reuse]]
+                )
 
-        batch_size = 16
-        all_vecs = []
+        if reuse is None or reuse.all():
+            return self._append(docs, vectors, hashes)
+        embed = ~reuse
         try:
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                vecs = self.embeddings.embed_documents(batch)
-                all_vecs.extend(vecs)
+            with span("ingest_embed", chunks=int(embed.sum())):
+                fresh = self.embeddings.embed_documents(
+                    [d["content"] for d, e in zip(docs, embed) if e]
+                )
         except Exception as e:
             raise RuntimeError(f"Embedding failed: {type(e).__name__}: {e}")
+        fresh = np.array(fresh, dtype=np.float32)
+        if vectors.shape[1] != fresh.shape[1]:
+            vectors = np.empty((len(docs), fresh.shape[1]), dtype=np.float32)
+        vectors[embed] = fresh
+        return self._append(docs, vectors, hashes)
+
+    def _append(self, docs: List[Dict], vectors: np.ndarray, hashes: np.ndarray) -> int:
+        with self._lock.write():
+            added = self._append_locked(docs, vectors, hashes)
+        self._maybe_compact()
+        return added
+
+    def _append_locked(self, docs: List[Dict], vectors: np.ndarray, hashes: np.ndarray) -> int:
+        with span("ingest_write", chunks=len(docs)):
+            # Another writer may have stored the same chunks while we embedded.
+            fresh = ~self._contains_in_sources(hashes, [d["source"] for d in docs])
+            if not fresh.any():
+                return 0
+            docs = [d for d, f in zip(docs, fresh) if f]
+            vectors = _normalize(vectors[fresh])
+            texts = [d["content"] for d in docs]
+            metadatas = [
+                {"source": d["source"], "chunk_index": d["chunk_index"],
+                 **{k: d[k] for k in LOCATION_KEYS if k in d}}
+                for d in docs
+            ]
+            columns = {
+                "hash": hashes[fresh],
+                "source": np.array(
+                    [self._store.source_code(d["source"], create=True) for d in docs],
+                    dtype=np.int32,
+                ),
+                "ftype": np.array(
+                    [self._store.label_code("file_types", file_type(d["source"]), create=True)
+                     for d in docs],
+                    dtype=np.int16,
+                ),
+                "chunk": np.array([d["chunk_index"] for d in docs], dtype=np.int32),
+                "ingested": np.full(len(docs), time.time(), dtype=np.float64),
+            }
+            columns.update(quantized_columns(vectors, self.vector_dtype))
+            rows = self._store.append(vectors, texts, metadatas, columns=columns)
+            self.index.add(rows)
+            self.lexical.add(rows, texts)
+            self._extend_postings(rows, columns)
+            incr("ingest_chunks", len(docs))
+            return len(docs)
+
+    def export_source(self, source: str) -> Tuple[List[Dict], np.ndarray]:
+        """Live chunks of a source as documents plus their stored vectors."""
+        with self._lock.read():
+            rows = self._source_rows(source)
+            docs = []
+            for row in rows:
+                text, meta = self._store.record(int(row))
+                docs.append({
+                    "content": text,
+                    "source": meta["source"],
+                    "chunk_index": _chunk_number(meta["chunk_index"]),
+                    **{k: meta[k] for k in LOCATION_KEYS if k in meta},
+                })
+            return docs, self._store.vectors_for(rows)
+
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        return np.isin(hashes, self._hashes()[self._store.live_mask()])
+
+    def _contains_in_sources(self, hashes: np.ndarray, sources: List[str]) -> np.ndarray:
+        """Which chunk hashes are stored and live under the matching source."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        names = np.array(sources, dtype=object)
+        found = np.zeros(len(hashes), dtype=bool)
+        stored = self._hashes()
+        for source in set(sources):
+            mask = names == source
+            found[mask] = np.isin(hashes[mask], stored[self._source_rows(source)])
+        return found
+
+    def _live_rows_for(self, hashes: np.ndarray) -> Dict[int, int]:
+        """A live row holding each of ``hashes`` that is stored under any source."""
+        live = np.flatnonzero(self._store.live_mask())
+        stored = self._hashes()[live]
+        match = np.isin(stored, np.asarray(hashes, dtype=np.uint64))
+        return dict(zip(stored[match].tolist(), live[match].tolist()))
+
+    def contains_hashes(self, hashes) -> np.ndarray:
+        """Boolean mask telling which chunk hashes are stored and live."""
+        with self._lock.read():
+            return self._contains(hashes)
+
+    def delete_source(self, source: str) -> int:
+        """Tombstone every chunk of a source; returns the rows removed."""
+        with self._lock.write():
+            deleted = self._store.delete(self._source_rows(source))
+        self._maybe_compact()
+        return deleted
+
+    def upsert_source(self, source: str, documents: List[Dict[str, str]]) -> Dict[str, int]:
+        """Replace the chunks of ``source`` with ``documents``.
+
+        Chunks with unchanged text and position keep their rows, moved ones
+        reuse their stored vectors, and only new text is embedded; chunks
+        that disappeared are tombstoned. The cost follows the size of this
+        source, not of the store. Returns counts of ``kept``, ``reused``,
+        ``embedded`` and ``deleted`` rows.
+        """
+        docs = self._clean_docs([{**d, "source": source} for d in documents])
+        hashes = np.array([chunk_hash(d["content"]) for d in docs], dtype=np.uint64)
+        first = np.zeros(len(docs), dtype=bool)
+        first[np.unique(hashes, return_index=True)[1]] = True
+        docs = [d for d, f in zip(docs, first) if f]
+        hashes = hashes[first]
+        keys = [(int(h), d["chunk_index"]) for h, d in zip(hashes, docs)]
+
+        with self._lock.read():
+            rows = self._source_rows(source)
+            old_hashes = self._hashes()[rows]
+            old_keys = set(zip(old_hashes.tolist(), self._chunk_numbers()[rows].tolist()))
+            old_rows = dict(zip(old_hashes.tolist(), rows.tolist()))
+            # Text stored under another source gets its own row, with that
+            # source's vector.
+            kept = np.array([key in old_keys for key in keys], dtype=bool)
+            new = hashes[~kept & ~np.isin(hashes, old_hashes)]
+            known = {**self._live_rows_for(new), **old_rows} if len(new) else old_rows
+            reuse = ~kept & np.array([key[0] in known for key in keys], dtype=bool)
+            vectors = np.empty((len(docs), self._store.dim or 0), dtype=np.float32)
+            vectors[reuse] = self._store.vectors_for(
+                [known[key[0]] for key, r in zip(keys, reuse) if r]
+            )
+
+        embed = ~kept & ~reuse
+        if embed.any():
+            try:
+                with span("ingest_embed", chunks=int(embed.sum())):
+                    fresh = self.embeddings.embed_documents(
+                        [d["content"] for d, e in zip(docs, embed) if e]
+                    )
+            except Exception as e:
+                raise RuntimeError(f"Embedding failed: {type(e).__name__}: {e}")
+            fresh = np.array(fresh, dtype=np.float32)
+            if vectors.shape[1] != fresh.shape[1]:
+                vectors = np.empty((len(docs), fresh.shape[1]), dtype=np.float32)
+            vectors[embed] = fresh
+
+        add = reuse | embed
+        kept_keys = {key for key, k in zip(keys, kept) if k}
+        with self._lock.write():
+            rows = self._source_rows(source)
+            stale = [
+                row for row, key in zip(
+                    rows.tolist(),
+                    zip(self._hashes()[rows].tolist(), self._chunk_numbers()[rows].tolist()),
+                )
+                if key not in kept_keys
+            ]
+            deleted = self._store.delete(stale)
+            if add.any():
+                self._append_locked(
+                    [d for d, a in zip(docs, add) if a], vectors[add], hashes[add]
+                )
+        self._maybe_compact()
+        return {
+            "kept": int(kept.sum()),
+            "reused": int(reuse.sum()),
+            "embedded": int(embed.sum()),
+            "deleted": deleted,
+        }
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """Share of stored rows that are deleted but not yet compacted away."""
+        total = len(self._store)
+        return 1.0 - self._store.live_count / total if total else 0.0
+
+    def _maybe_compact(self) -> None:
+        if self.compact_threshold is None:
+            return
+        if self.tombstone_ratio < self.compact_threshold and not self._store.needs_merge:
+            return
+        if not self._compaction_lock.acquire(blocking=False):
+            return  # already running
+
+        def run() -> None:
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"⚠️ Compaction failed: {type(e).__name__}: {e}")
+                return
+            finally:
+                self._compaction_lock.release()
+            # Triggers that arrived while this pass ran were dropped above.
+            self._maybe_compact()
 
-        vecs_np = np.array(all_vecs, dtype=np.float32)
+        threading.Thread(target=run, name="store-compaction", daemon=True).start()
 
-        if self._emb.size == 0:
-            self._emb = vecs_np
-        else:
-            self._emb = np.vstack([self._emb, vecs_np])
+    def compact(self) -> int:
+        """Rewrite segments with deleted rows and merge small ones; returns the rows dropped.
 
-        self._meta.extend(metadatas)
-        self._texts.extend(texts)
-        self._save()
+        Runs under the write lock and only touches segments with deletions
+        or small neighbours. Row ids change, so the index, BM25 sidecars and
+        row lists are renumbered with them.
+        """
+        with self._lock.write(), span("compact"):
+            index = self.index  # opened against the old row ids
+            keep = self._store.compact(on_segment=self.lexical.rewrite_segment)
+            if keep is None:
+                return 0
+            index.compacted(keep)
+            self.lexical.reset()
+            self._inverted.clear()
+            return int(len(keep) - keep.sum())
 
-    def search(self, query: str, k: int = 3) -> List[Tuple[str, Dict, float]]:
-        if self._emb.size == 0:
+    def search(self, query: str, k: int = 3,
+               where: Optional[Dict] = None) -> List[Tuple[str, Dict, float]]:
+        """Cosine top-k, optionally restricted to rows matching ``where``."""
+        if len(self) == 0:
             return []
 
-        q = np.array(self.embeddings.embed_query(query), dtype=np.float32)
-        norms = np.linalg.norm(self._emb, axis=1) * (np.linalg.norm(q) + 1e-8)
-        scores = (self._emb @ q) / (norms + 1e-8)
-        top = np.argsort(-scores)[:k]
-        return [
-            (self._texts[int(i)], self._meta[int(i)], float(scores[int(i)]))
-            for i in top
-        ]
+        return self.search_by_vector(self.embed_query(query), k=k, where=where)
+
+    def search_many(self, queries: List[str], k: int = 3,
+                    where: Optional[Dict] = None) -> List[List[Tuple[str, Dict, float]]]:
+        """``search`` for many queries: one embedding round, batched scoring."""
+        if not queries:
+            return []
+        if len(self) == 0:
+            return [[] for _ in queries]
+        return self.search_many_by_vector(self.embed_queries(queries), k=k, where=where)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """(n, dim) unit-norm query embeddings; cached ones are not re-sent."""
+        with span("embed_queries", queries=len(queries)):
+            if hasattr(self.embeddings, "embed_queries"):
+                vectors = self.embeddings.embed_queries(queries)
+            else:
+                vectors = [self.embeddings.embed_query(q) for q in queries]
+        vectors = _normalize(np.array(vectors, dtype=np.float32))
+        self._remember_queries(queries, vectors)
+        return vectors
+
+    def search_many_by_vector(self, query_vectors, k: int = 3,
+                              where: Optional[Dict] = None) -> List[List[Tuple[str, Dict, float]]]:
+        """Cosine top-k for each row of an (n, dim) query matrix."""
+        q = _normalize(np.atleast_2d(query_vectors))
+        if len(self) == 0:
+            return [[] for _ in q]
+        with self._lock.read():
+            with span("vector_search_many", queries=len(q)):
+                if where:
+                    rows = self._filter_rows(where)
+                    hits = [self.index.search_rows(vec, k, rows) for vec in q]
+                else:
+                    hits = self.index.search_many(q, k, self._store.live_mask())
+            return [
+                [self._result(int(i), float(score)) for i, score in zip(rows, scores)]
+                for rows, scores in hits
+            ]
+
+    async def asearch(self, query: str, k: int = 3,
+                      where: Optional[Dict] = None) -> List[Tuple[str, Dict, float]]:
+        """Async ``search``: the embedding call is awaited, scoring runs in a worker thread."""
+        if len(self) == 0:
+            return []
+        vector = await self.aembed_query(query)
+        return await asyncio.to_thread(self.search_by_vector, vector, k, where)
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        with span("embed_query"):
+            if hasattr(self.embeddings, "aembed_query"):
+                vector = await self.embeddings.aembed_query(query)
+            else:
+                vector = await asyncio.to_thread(self.embeddings.embed_query, query)
+        vector = _normalize(np.array(vector, dtype=np.float32))
+        self._remember_queries([query], [vector])
+        return vector
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Unit-norm query embedding (served from the embedding cache when possible)."""
+        with span("embed_query"):
+            vector = self.embeddings.embed_query(query)
+        vector = _normalize(np.array(vector, dtype=np.float32))
+        self._remember_queries([query], [vector])
+        return vector
+
+    def _remember_queries(self, queries: List[str], vectors) -> None:
+        with self._query_vectors_lock:
+            for query, vector in zip(queries, vectors):
+                self._query_vectors[query] = vector
+                self._query_vectors.move_to_end(query)
+            while len(self._query_vectors) > _RECENT_QUERIES:
+                self._query_vectors.popitem(last=False)
+
+    def query_vector_if_known(self, query: str) -> Optional[np.ndarray]:
+        """The query's embedding if this store computed it recently, else None.
+
+        Never calls the embedding model: lexical searches and hybrid
+        searches that skipped the vector stage leave no vector behind.
+        """
+        with self._query_vectors_lock:
+            return self._query_vectors.get(query)
+
+    def search_by_vector(self, query_vector, k: int = 3,
+                         where: Optional[Dict] = None) -> List[Tuple[str, Dict, float]]:
+        """Cosine top-k for an already embedded query.
+
+        With ``where``, only the matching rows are scored (see ``_filter_rows``).
+        """
+        if len(self) == 0:
+            return []
+
+        q = _normalize(query_vector)
+        with self._lock.read():
+            with span("vector_search"):
+                if where:
+                    top, scores = self.index.search_rows(q, k, self._filter_rows(where))
+                else:
+                    top, scores = self.index.search(q, k, self._store.live_mask())
+            return [
+                self._result(int(i), float(score))
+                for i, score in zip(top, scores)
+            ]
+
+    def _live_or_filtered(self, where: Optional[Dict]) -> np.ndarray:
+        if not where:
+            return self._store.live_mask()
+        mask = np.zeros(len(self._store), dtype=bool)
+        mask[self._filter_rows(where)] = True
+        return mask
+
+    def lexical_search(self, query: str, k: int = 3,
+                       where: Optional[Dict] = None) -> List[Tuple[str, Dict, float]]:
+        """BM25 top-k; needs no embedding call."""
+        with self._lock.read(), span("lexical_search"):
+            rows, scores, _ = self.lexical.search(query, k, self._live_or_filtered(where))
+            return [self._result(int(i), float(s)) for i, s in zip(rows, scores)]
+
+    def hybrid_search(self, query: str, k: int = 3, fetch_k: Optional[int] = None,
+                      rrf_k: int = 60, skip_vector_coverage: float = 1.0,
+                      skip_vector_margin: float = 2.0,
+                      where: Optional[Dict] = None) -> List[Tuple[str, Dict, float]]:
+        """Fuse BM25 and cosine rankings of the top ``fetch_k`` (default 4k) each.
+
+        The query is not embedded when the best lexical hit is decisive:
+        it contains at least ``skip_vector_coverage`` of the query terms
+        (idf-weighted) and outscores the runner-up by ``skip_vector_margin``.
+        Scores are reciprocal-rank-fusion scores (or BM25 when skipped).
+        """
+        if len(self) == 0:
+            return []
+        fetch_k = fetch_k or 4 * k
+        lexical, decisive = self._lexical_candidates(
+            query, fetch_k, where, skip_vector_coverage, skip_vector_margin
+        )
+        if decisive:
+            return lexical[:k]
+        vector = self.search_by_vector(self.embed_query(query), k=fetch_k, where=where)
+        return self._fuse(lexical, vector, k, rrf_k)
+
+    async def ahybrid_search(self, query: str, k: int = 3, fetch_k: Optional[int] = None,
+                             rrf_k: int = 60, skip_vector_coverage: float = 1.0,
+                             skip_vector_margin: float = 2.0,
+                             where: Optional[Dict] = None) -> List[Tuple[str, Dict, float]]:
+        """Async ``hybrid_search``."""
+        if len(self) == 0:
+            return []
+        fetch_k = fetch_k or 4 * k
+        lexical, decisive = await asyncio.to_thread(
+            self._lexical_candidates, query, fetch_k, where,
+            skip_vector_coverage, skip_vector_margin,
+        )
+        if decisive:
+            return lexical[:k]
+        vector = await self.aembed_query(query)
+        vector = await asyncio.to_thread(self.search_by_vector, vector, fetch_k, where)
+        return self._fuse(lexical, vector, k, rrf_k)
+
+    def _lexical_candidates(self, query: str, fetch_k: int, where: Optional[Dict],
+                            skip_vector_coverage: float, skip_vector_margin: float):
+        with self._lock.read(), span("lexical_search"):
+            rows, scores, coverage = self.lexical.search(
+                query, fetch_k, self._live_or_filtered(where)
+            )
+            lexical = [self._result(int(i), float(s)) for i, s in zip(rows, scores)]
+        decisive = len(rows) > 0 and coverage[0] >= skip_vector_coverage and (
+            len(rows) == 1 or scores[0] >= skip_vector_margin * scores[1]
+        )
+        if decisive:
+            incr("hybrid_vector_skipped")
+        return lexical, decisive
+
+    @staticmethod
+    def _fuse(lexical, vector, k: int, rrf_k: int) -> List[Tuple[str, Dict, float]]:
+        by_id = {meta["chunk_id"]: (text, meta) for text, meta, _ in lexical + vector}
+        fused = reciprocal_rank_fusion(
+            [[meta["chunk_id"] for _, meta, _ in ranking] for ranking in (lexical, vector)],
+            k=rrf_k,
+        )
+        return [(*by_id[chunk_id], score) for chunk_id, score in fused[:k]]
+
+    def _result(self, row: int, score: float) -> Tuple[str, Dict, float]:
+        text, meta = self._store.record(row)
+        # Content hash + source code: stable across compaction (row numbers
+        # are not) and unique, since a source stores each text once.
+        meta["chunk_id"] = f"{int(self._hashes()[row]):016x}-{int(self._source_codes()[row])}"
+        meta["chunk_index"] = int(self._chunk_numbers()[row])
+        return text, meta, score
 
     def clear_store(self) -> None:
-        self._emb = np.empty((0, 768), dtype=np.float32)
-        self._meta = []
-        self._texts = []
-        self._save()
+        with self._lock.write():
+            self._store.clear()
+            self.index.reset()
+            self.lexical.reset()
+            self._inverted.clear()